@@ -0,0 +1,57 @@
+import hashlib
+import logging
+import os
+import tkinter as tk
+
+ASSET_FOLDER = os.path.join("cache", "assets")
+
+
+def fit_size(width, height, max_size):
+    """Scale (width, height) so the longer side is max_size."""
+    if width > height:
+        return max_size, int(height * (max_size / width))
+    return int(width * (max_size / height)), max_size
+
+
+class AssetCache(object):
+    """Pre-scaled copies of images, stored as PNG files Tk can load directly.
+
+    Variants are keyed on a hash of the source file and the target size, so
+    an edited or replaced image is scaled again. Pillow is only imported
+    (and only resamples) when a variant is missing.
+    """
+
+    def __init__(self, folder=ASSET_FOLDER):
+        self.folder = folder
+
+    def _variant_path(self, path, max_size):
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.folder, "{0}-{1}-{2}.png".format(name, digest[:16], max_size))
+
+    def scaled_image(self, path, max_size):
+        """Return a PhotoImage of the image at path, scaled so its longer
+        side is max_size."""
+        variant_path = self._variant_path(path, max_size)
+        if os.path.exists(variant_path):
+            try:
+                return tk.PhotoImage(file=variant_path)
+            except tk.TclError as e:
+                # E.g. a Tk without PNG support
+                logging.warning("Cannot load cached image {0}: {1}".format(variant_path, e))
+
+        from PIL import Image, ImageTk
+
+        img = Image.open(path)
+        img = img.resize(fit_size(img.size[0], img.size[1], max_size), Image.LANCZOS)
+        try:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            tmp_path = variant_path + ".tmp"
+            img.save(tmp_path, "PNG")
+            os.replace(tmp_path, variant_path)
+            logging.info("Cached scaled image {0}".format(variant_path))
+        except Exception as e:
+            logging.error("Failed to cache scaled image {0}: {1}".format(variant_path, e))
+        return ImageTk.PhotoImage(img)
@@ -0,0 +1,244 @@
+"""Headless benchmark of the load/parse/sort/style/render pipeline.
+
+Run with ``novium.py --bench [options] [fixture.json ...]``. Fixtures are
+departure responses as returned by transport.rest, or recordings (.jsonl,
+see replay.py) whose departures responses are all used. Without fixtures a
+synthetic response is generated. The load stage only reads fixture files
+from disk (generated responses take no time there); the network is never
+used. Rendering needs a display (e.g. Xvfb);
+with ``--renderer none`` or without a display the render stage is skipped.
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+from modules.departures import (compile_mapping, parse_departures_response, response_fields,
+                                select_departures, utc_now)
+from modules.linestyles import LineStyleMatcher
+from modules.metrics import count_widgets
+from modules.utils.luacfgparser import parse_lua_cfg
+
+STAGES = ("load", "parse", "sort", "style", "render")
+
+
+def load_fixtures(paths):
+    """Expand recordings (.jsonl) into the departures responses they hold.
+    Other paths are fixture files, read again in every round."""
+    fixtures = []
+    for path in paths:
+        if not path.endswith(".jsonl"):
+            fixtures.append(path)
+            continue
+        from modules.replay import load_recording
+        for key, (_, entries) in sorted(load_recording(path).items()):
+            if key[0].endswith("/departures"):
+                fixtures.extend(entry["body"] for entry in entries if entry["status"] == 200)
+    return fixtures
+
+
+def make_fixture(count=120, seed=1):
+    """Build a transport.rest-like departures response with count entries."""
+    rng = random.Random(seed)
+    lines = ["S5", "S7", "S75", "U2", "U5", "U8", "M4", "M5", "M6", "100", "200",
+             "248", "TXL", "RE1", "RE2", "RB23", "ICE 1003", "IC 2431", "FEX", "N8"]
+    destinations = ["S+U Alexanderplatz", "S Ahrensfelde", "S Wartenberg", "U Pankow",
+                    "S+U Hauptbahnhof", "Flughafen BER Terminal 1-2", "S Spandau",
+                    "Hönow", "U Rathaus Spandau", "Frankfurt (Oder)", "Magdeburg Hbf",
+                    "S Potsdam Hauptbahnhof", "U Hermannstr.", "Michelangelostr."]
+    now = utc_now()
+    departures = []
+    for index in range(count):
+        planned = now + timedelta(seconds=rng.randint(-60, 3600))
+        delay = rng.choice([None, 0, 0, 60, 120, 300])
+        when = planned + timedelta(seconds=delay or 0)
+        departures.append({
+            "tripId": "1|{0}|0|86|1012026".format(10000 + index),
+            "stop": {"type": "stop", "id": "900003201", "name": "S+U Berlin Hauptbahnhof"},
+            "when": when.isoformat(),
+            "plannedWhen": planned.isoformat(),
+            "delay": delay,
+            "platform": str(rng.randint(1, 16)),
+            "plannedPlatform": str(rng.randint(1, 16)),
+            "direction": rng.choice(destinations),
+            "line": {"type": "line", "id": "l{0}".format(index), "name": rng.choice(lines),
+                     "product": "suburban", "mode": "train"},
+            "destination": {"type": "stop", "id": "9000{0}".format(index), "name": rng.choice(destinations)},
+            "cancelled": rng.random() < 0.03,
+            "remarks": [{"type": "hint", "code": "FB", "text": "Fahrradmitnahme begrenzt möglich"}],
+        })
+    return {"departures": departures, "realtimeDataUpdatedAt": int(time.time())}
+
+
+def count_canvas_items(widget):
+    count = 0
+    if widget.winfo_class() == "Canvas":
+        count += len(widget.find_all())
+    for child in widget.winfo_children():
+        count += count_canvas_items(child)
+    return count
+
+
+def create_board(renderer, config):
+    """Return (root, board), or (None, None) if rendering is not possible."""
+    if renderer == "none":
+        return None, None
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print("No display available ({0}), skipping the render stage".format(e))
+        return None, None
+
+    from modules.board import DepartureBoard
+    from modules.canvasboard import CanvasDepartureBoard
+    from modules.marquee import MarqueeDriver
+
+    root.geometry("1024x768")
+    content_frame = tk.Frame(root, bg="#122080")
+    content_frame.pack(expand=True, fill=tk.BOTH)
+    root.update()
+    line_styles = LineStyleMatcher(config.get("LineStyles", {}))
+    board_class = CanvasDepartureBoard if renderer == "canvas" else DepartureBoard
+    return root, board_class(content_frame, MarqueeDriver(root), line_styles)
+
+
+def check_render(board, departures):
+    """Return what is wrong with the rows the board shows for departures,
+    e.g. rows that were never placed or still show another trip."""
+    problems = []
+    if len(board.rows) != len(departures):
+        problems.append("{0} rows shown for {1} departures".format(len(board.rows), len(departures)))
+    for index, (row, departure) in enumerate(zip(board.rows, departures)):
+        if row.key != departure.key:
+            problems.append("row {0} belongs to another trip".format(index))
+        elif row.state.get("destination", {}).get("text") != departure.destination:
+            problems.append("row {0} shows another destination".format(index))
+        elif "time" not in row.state:
+            problems.append("row {0} has no time".format(index))
+        elif getattr(row, "y", 0) is None:
+            problems.append("row {0} was never placed".format(index))
+    return problems
+
+
+def format_ms(seconds):
+    return "{0:8.2f}".format(seconds * 1000)
+
+
+def replay(fixture, is_file, fields, accessors, line_styles, max_rows, root, board, timings):
+    """Push one fixture through every stage, appending the time each took.
+    Returns the departures that were rendered."""
+    start = time.perf_counter()
+    if is_file:
+        with open(fixture, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = fixture
+    timings["load"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    data = parse_departures_response(text, fields)
+    timings["parse"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    departures = select_departures(data.get("departures", []), accessors, max_rows, utc_now())
+    timings["sort"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for departure in departures:
+        line_styles.match(departure.line)
+    timings["style"].append(time.perf_counter() - start)
+
+    if board is not None:
+        start = time.perf_counter()
+        board.show_departures(departures)
+        root.update_idletasks()
+        timings["render"].append(time.perf_counter() - start)
+    return departures
+
+
+def run(fixtures, config, renderer="widgets", rounds=20, max_rows=15):
+    """Replay every fixture rounds times and return the collected timings."""
+    fields = response_fields(config.get("CustomResponseMapping", {}))
+    accessors = compile_mapping(config.get("CustomResponseMapping", {}))
+    line_styles = LineStyleMatcher(config.get("LineStyles", {}))
+    root, board = create_board(renderer, config)
+
+    # Generated responses are only serialised once, fixture files are read
+    # again in the load stage
+    fixtures = [fixture if isinstance(fixture, str) else json.dumps(fixture) for fixture in fixtures]
+    from_file = [not fixture.lstrip().startswith("{") for fixture in fixtures]
+
+    timings = dict((stage, []) for stage in STAGES)
+    problems = []
+    for _ in range(rounds):
+        for fixture, is_file in zip(fixtures, from_file):
+            departures = replay(fixture, is_file, fields, accessors, line_styles, max_rows, root, board, timings)
+            if board is not None:
+                problems.extend(check_render(board, departures))
+
+    # Tracing slows allocations down a lot, so memory gets a round of its own
+    tracemalloc.start()
+    try:
+        for fixture, is_file in zip(fixtures, from_file):
+            replay(fixture, is_file, fields, accessors, line_styles, max_rows, root, board,
+                   dict((stage, []) for stage in STAGES))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {"timings": timings, "peak_memory": peak_memory, "widgets": None, "canvas_items": None,
+              "problems": problems}
+    if root is not None:
+        result["widgets"] = count_widgets(root)
+        result["canvas_items"] = count_canvas_items(root)
+        root.destroy()
+    return result
+
+
+def report(result, out=sys.stdout):
+    out.write("{0:<8} {1:>8} {2:>8} {3:>8} {4:>8} {5:>6}\n".format(
+        "stage", "first ms", "min ms", "med ms", "max ms", "runs"))
+    for stage in STAGES:
+        values = result["timings"][stage]
+        if not values:
+            out.write("{0:<8} {1:>8}\n".format(stage, "skipped"))
+            continue
+        ordered = sorted(values)
+        out.write("{0:<8} {1} {2} {3} {4} {5:6d}\n".format(
+            stage, format_ms(values[0]), format_ms(ordered[0]),
+            format_ms(ordered[len(ordered) // 2]), format_ms(ordered[-1]), len(values)))
+    if result["widgets"] is not None:
+        out.write("Tk widgets:   {0}\n".format(result["widgets"]))
+        out.write("Canvas items: {0}\n".format(result["canvas_items"]))
+    out.write("Peak traced Python memory: {0:.1f} KiB\n".format(result["peak_memory"] / 1024.0))
+    if result["timings"]["render"]:
+        # The first ones are enough, the same problem tends to repeat every round
+        for problem in result["problems"][:10]:
+            out.write("Render problem: {0}\n".format(problem))
+        if not result["problems"]:
+            out.write("Render check: ok\n")
+
+
+def main(argv, config_file="novium.cfg"):
+    parser = argparse.ArgumentParser(prog="novium.py --bench", description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", nargs="*", help="recorded departures responses (JSON or .jsonl recordings)")
+    parser.add_argument("--renderer", choices=("widgets", "canvas", "none"), default="widgets")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=15, help="rows rendered per board")
+    parser.add_argument("--synthetic-size", type=int, default=120,
+                        help="departures in the generated response when no fixture is given")
+    parser.add_argument("--config", default=config_file)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    config = parse_lua_cfg(args.config)
+    fixtures = load_fixtures(args.fixtures) or [make_fixture(args.synthetic_size)]
+
+    result = run(fixtures, config, renderer=args.renderer, rounds=args.rounds, max_rows=args.rows)
+    report(result)
+    return 1 if result["problems"] else 0
@@ -0,0 +1,333 @@
+import tkinter as tk
+import logging
+
+from modules.departures import utc_now
+from modules.layout import BASE_HEIGHT, BASE_WIDTH, HEADER_HEIGHT, LINE_FONT_SIZE, LINE_PADDING, Layout, TextMeasurer
+
+BOARD_BG_COLOR = "#122080"
+BOARD_FG_COLOR = "white"
+
+
+def format_countdown(departure_time, now=None):
+    """Format an aware departure time as shown in the time column."""
+    try:
+        if departure_time is None:
+            return "N/A"
+        if now is None:
+            now = utc_now()
+        time_difference = (departure_time - now).total_seconds()
+        if 0 < time_difference <= 44 * 60:
+            minutes = int(time_difference // 60)
+            return "{0} min".format(minutes)
+        elif time_difference <= 0:
+            return "Jetzt "
+        else:
+            return departure_time.strftime("%H:%M")
+    except Exception:
+        logging.exception("Failed to format departure time")
+        return "N/A"
+
+
+class DepartureRow(object):
+    """The widgets of one departure row. Rows are kept alive and reconfigured
+    instead of being destroyed on every refresh."""
+
+    def __init__(self, parent, marquee, layout):
+        self.marquee = marquee
+        self.layout = layout
+        self.frame = tk.Frame(parent, bg=BOARD_BG_COLOR, height=layout.row_height)
+        self.frame.pack_propagate(False)
+
+        self.line_display_frame = tk.Frame(self.frame, bg=BOARD_BG_COLOR, width=layout.badge_width)
+        self.line_display_frame.pack_propagate(False)
+        self.line_display_frame.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.line_label = tk.Label(self.line_display_frame, fg=BOARD_FG_COLOR, bg=BOARD_BG_COLOR)
+        self.line_label.pack(padx=LINE_PADDING, pady=0, fill=tk.BOTH, expand=True)
+
+        self.destination_label = tk.Label(self.frame, fg=BOARD_FG_COLOR, bg=BOARD_BG_COLOR,
+                                          font=layout.destination_font)
+        self.destination_label.pack(side=tk.LEFT, padx=layout.padding, pady=(5, 0))
+
+        # Only packed while the destination needs a marquee
+        self.spacer_frame = tk.Frame(self.frame, bg=BOARD_BG_COLOR)
+
+        self.time_label = tk.Label(self.frame, bg=BOARD_BG_COLOR)
+        self.time_label.pack(side=tk.RIGHT, padx=layout.padding, pady=(5, 0))
+
+        # Only packed while there is a platform to show
+        self.platform_label = tk.Label(self.frame, fg=BOARD_FG_COLOR, bg=BOARD_BG_COLOR,
+                                       font=layout.platform_font)
+
+        # Last applied values, so unchanged options are never re-configured
+        self.state = {}
+        self.key = None
+        self.departure = None
+        self.style = None
+        self.departure_time = None
+        self.cancelled = False
+
+    def _set(self, name, widget, **options):
+        if self.state.get(name) == options:
+            return False
+        widget.config(**options)
+        self.state[name] = options
+        return True
+
+    def update(self, departure, style):
+        """Apply a Departure record to this row. Returns the set of texts that
+        changed and therefore need their overflow re-checked."""
+        changed = set()
+        line_name = departure.line
+        destination_name = departure.destination
+
+        self.departure = departure
+        self.style = style
+        self.departure_time = departure.when
+        self.cancelled = departure.cancelled
+        if self.cancelled:
+            platform_display_text = ""
+        else:
+            platform_display_text = str(departure.platform) if departure.platform else ""
+
+        line_label_bg = style.get("bg", BOARD_BG_COLOR)
+        line_label_fg = style.get("fg", BOARD_FG_COLOR)
+        line_font_size = style.get("font_size", LINE_FONT_SIZE)
+
+        self._set("line_frame", self.line_display_frame, bg=line_label_bg)
+        if self._set("line", self.line_label, text=line_name, fg=line_label_fg, bg=line_label_bg,
+                     font=self.layout.line_font(line_font_size)):
+            self.marquee.unregister(self.line_label)
+            changed.add("line")
+
+        if self._set("destination", self.destination_label, text=destination_name):
+            self.marquee.unregister(self.destination_label)
+            self.spacer_frame.pack_forget()
+            changed.add("destination")
+
+        # The time and platform columns take the room left for the destination
+        columns_changed = self._tick(None)
+
+        if self._set("platform", self.platform_label, text=platform_display_text):
+            columns_changed = True
+            if platform_display_text:
+                self.platform_label.pack(side=tk.RIGHT, padx=self.layout.padding, pady=(5, 0))
+            else:
+                self.platform_label.pack_forget()
+
+        if columns_changed:
+            changed.add("destination")
+        return changed
+
+    def _tick(self, now):
+        if self.cancelled:
+            return self._set("time", self.time_label, text="Fahrt fällt aus", fg="red",
+                             font=self.layout.cancelled_font)
+        return self._set("time", self.time_label, text=format_countdown(self.departure_time, now), fg="white",
+                         font=self.layout.time_font)
+
+    def tick(self, now=None):
+        """Refresh the time column from the parsed departure time."""
+        if self._tick(now) and "destination" in self.state and "platform" in self.state:
+            self.check_overflow(("destination",))
+
+    def apply_layout(self, layout):
+        """Resize the row and its fonts for a new board layout."""
+        self.layout = layout
+        self.frame.config(height=layout.row_height)
+        self.line_display_frame.config(width=layout.badge_width)
+        self.destination_label.config(font=layout.destination_font)
+        self.destination_label.pack_configure(padx=layout.padding)
+        self.time_label.pack_configure(padx=layout.padding)
+        self.platform_label.config(font=layout.platform_font)
+        if self.platform_label.winfo_manager():
+            self.platform_label.pack_configure(padx=layout.padding)
+        if self.key is not None:
+            self.update(self.departure, self.style)
+
+    def check_overflow(self, changed):
+        """Start marquees for texts that do not fit. Texts are measured with
+        the layout's fonts, so this never waits for a layout pass."""
+        layout = self.layout
+        if "line" in changed:
+            line = self.state["line"]
+            if layout.line_fits(line["text"], line["font"]):
+                self._stop_marquee("line", self.line_label)
+            elif not self.marquee.is_registered(self.line_label):
+                self.marquee.register(self.line_label, line["text"])
+
+        if "destination" in changed:
+            text = self.state["destination"]["text"]
+            time_state = self.state["time"]
+            available = layout.destination_width(time_state["text"], time_state["font"],
+                                                 self.state["platform"]["text"])
+            if layout.measure(text, layout.destination_font) <= available:
+                self._stop_marquee("destination", self.destination_label)
+                self.spacer_frame.pack_forget()
+            elif not self.marquee.is_registered(self.destination_label):
+                self.marquee.register(self.destination_label, text)
+                self.spacer_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True,
+                                       after=self.destination_label)
+
+    def _stop_marquee(self, name, label):
+        if self.marquee.is_registered(label):
+            self.marquee.unregister(label)
+            # Restore the real text the marquee has rotated
+            label.config(text=self.state[name]["text"])
+
+    def hide(self):
+        for name, label in (("line", self.line_label), ("destination", self.destination_label)):
+            if name in self.state:
+                self._stop_marquee(name, label)
+                # A reused row has to check the overflow again, even for the same text
+                del self.state[name]
+        self.frame.pack_forget()
+        self.key = None
+        self.departure = None
+        self.style = None
+
+
+class DepartureBoard(object):
+    """Renders departures into the content frame, reconciling a persistent pool
+    of rows keyed by trip identity against each new departure list."""
+
+    def __init__(self, content_frame, marquee, line_styles, shares_window=False):
+        self.content_frame = content_frame
+        # True for the sections of a combined board, see Layout
+        self.shares_window = shares_window
+        self.marquee = marquee
+        self.line_styles = line_styles  # LineStyleMatcher
+        self.rows = []  # rows currently shown, in display order
+        self.spare_rows = []  # hidden rows ready for reuse
+        self.message_label = None
+        self.delays = {}  # last known delay per trip key
+
+        # Called when the number of rows that fit changes
+        self.on_resize = None
+        self.measurer = TextMeasurer(content_frame)
+        # The base design until the content frame has a size
+        self.layout = Layout(BASE_WIDTH, BASE_HEIGHT - HEADER_HEIGHT, self.measurer)
+        self.sized = False
+        content_frame.bind("<Configure>", self._on_configure)
+        if content_frame.winfo_ismapped():
+            # E.g. after switching renderers, no Configure event will come
+            self._resize(content_frame.winfo_width(), content_frame.winfo_height())
+
+    def max_rows(self):
+        """Rows that fit on the board, or None until it has been laid out."""
+        return self.layout.max_rows if self.sized else None
+
+    def _on_configure(self, event):
+        self._resize(event.width, event.height)
+
+    def _resize(self, width, height):
+        if self.sized and (width, height) == (self.layout.width, self.layout.height):
+            return
+        old_max_rows = self.max_rows()
+        window_height = None
+        if self.shares_window:
+            window_height = self.content_frame.winfo_toplevel().winfo_height()
+            if window_height <= 1:
+                # Not mapped yet
+                window_height = None
+        self.layout = Layout(width, height, self.measurer, window_height)
+        self.sized = True
+        self._apply_layout()
+        if self.layout.max_rows != old_max_rows and self.on_resize is not None:
+            self.on_resize()
+
+    def _apply_layout(self):
+        """Fit every row to the current layout."""
+        for row in self.spare_rows + self.rows:
+            row.apply_layout(self.layout)
+        self._arrange(self.rows)
+        for row in self.rows:
+            row.check_overflow(("line", "destination"))
+        self._layout_message()
+
+    def _layout_message(self):
+        if self.message_label is not None:
+            self.message_label.config(wraplength=self.layout.width - 40)
+
+    def _new_row(self):
+        return DepartureRow(self.content_frame, self.marquee, self.layout)
+
+    def _hide_message(self):
+        if self.message_label is not None:
+            self.message_label.pack_forget()
+
+    def _arrange(self, rows):
+        """Put the shown rows in display order."""
+        # Only re-pack when the order of rows actually changed
+        if [row.frame for row in rows] != self.content_frame.pack_slaves():
+            for row in rows:
+                row.frame.pack_forget()
+            for row in rows:
+                row.frame.pack(fill=tk.X, pady=1)
+
+    def _hide_rows(self):
+        for row in self.rows:
+            row.hide()
+        self.spare_rows.extend(self.rows)
+        self.rows = []
+
+    def show_message(self, text, font):
+        """Replace the departure rows with a full-size message."""
+        self._hide_rows()
+
+        if self.message_label is None:
+            self.message_label = tk.Label(self.content_frame, fg="white", bg=BOARD_BG_COLOR)
+        self.message_label.config(text=text, font=font, wraplength=self.layout.width - 40)
+        if not self.message_label.winfo_ismapped():
+            self.message_label.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+
+    def show_departures(self, departures):
+        """Show the given Departure records, in order.
+
+        Returns True if the delay of a trip that was already shown changed."""
+        if not self.content_frame.winfo_exists():
+            return False
+
+        delays_changed = False
+        delays = {}
+        for departure in departures:
+            delays[departure.key] = departure.delay
+            if departure.key in self.delays and self.delays[departure.key] != departure.delay:
+                delays_changed = True
+        self.delays = delays
+
+        self._hide_message()
+
+        rows_by_key = dict((row.key, row) for row in self.rows)
+        wanted_keys = set(departure.key for departure in departures)
+
+        # Rows for trips that are no longer shown become available for reuse
+        for row in self.rows:
+            if row.key not in wanted_keys:
+                row.hide()
+                self.spare_rows.append(row)
+
+        new_rows = []
+        for departure in departures:
+            row = rows_by_key.pop(departure.key, None)
+            if row is None:
+                row = self.spare_rows.pop() if self.spare_rows else self._new_row()
+                row.key = departure.key
+            new_rows.append(row)
+
+        self._arrange(new_rows)
+        self.rows = new_rows
+
+        for row, departure in zip(new_rows, departures):
+            style = self.line_styles.match(departure.line)
+            changed = row.update(departure, style)
+            if changed:
+                row.check_overflow(changed)
+
+        return delays_changed
+
+    def tick(self):
+        """Recompute the countdowns without touching anything else."""
+        now = utc_now()
+        for row in self.rows:
+            row.tick(now)
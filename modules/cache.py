@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class DepartureCache(object):
+    """Last successful response per departures query.
+
+    Kept in memory and mirrored to a JSON file, so a board can keep showing
+    (and counting down) the last good data while the API is unreachable, and
+    can show something immediately after a restart.
+    """
+
+    def __init__(self, path, max_staleness=900, save_interval=300):
+        self.path = path
+        self.max_staleness = max_staleness
+        # Unchanged responses (304s, responses still fresh by max-age) only
+        # renew fetchedAt, which is written at most this often
+        self.save_interval = save_interval
+        self._saved_at = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(url, params):
+        return url + "|" + "&".join("{0}={1}".format(k, v) for k, v in sorted(params.items()))
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+            logging.info("Loaded {0} cached departure response(s) from {1}".format(
+                len(self._entries), self.path))
+        except Exception as e:
+            logging.error("Failed to load departure cache {0}: {1}".format(self.path, e))
+            self._entries = {}
+
+    def store(self, key, data):
+        """Remember data as the latest good response. The file is only
+        rewritten when the data changed, or after save_interval, so polls
+        that bring nothing new do not wear out the disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            changed = entry is None or (entry["data"] is not data and entry["data"] != data)
+            # Entries too old to be shown again (e.g. of queries no board
+            # uses any more) would otherwise stay in the file forever
+            for old_key in [k for k, entry in self._entries.items()
+                            if now - entry["fetchedAt"] > self.max_staleness]:
+                del self._entries[old_key]
+                changed = True
+            self._entries[key] = {"fetchedAt": now, "data": data}
+            if changed or now - self._saved_at >= self.save_interval:
+                self._save()
+                self._saved_at = now
+
+    def get(self, key):
+        """Return (data, fetched_at) if a response younger than max_staleness
+        is cached, otherwise None."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["fetchedAt"] > self.max_staleness:
+            return None
+        return entry["data"], entry["fetchedAt"]
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            # Write to a temporary file first so a power cut never leaves a
+            # half-written cache behind
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error("Failed to write departure cache {0}: {1}".format(self.path, e))
@@ -0,0 +1,220 @@
+import tkinter as tk
+
+from modules.board import BOARD_BG_COLOR, BOARD_FG_COLOR, DepartureBoard, format_countdown
+from modules.layout import LINE_FONT_SIZE
+
+
+class CanvasText(object):
+    """Lets a canvas text item stand in for a Label, e.g. for the MarqueeDriver."""
+
+    def __init__(self, canvas, item):
+        self.canvas = canvas
+        self.item = item
+
+    def config(self, **options):
+        self.canvas.itemconfig(self.item, **options)
+
+    def winfo_exists(self):
+        return self.canvas.winfo_exists()
+
+
+class CanvasDepartureRow(object):
+    """One departure row drawn as items on the shared board canvas.
+
+    Z-order matters: the mask rectangle covers destinations that run into the
+    platform and time columns, and those texts are drawn above it.
+    """
+
+    def __init__(self, canvas, marquee, layout):
+        self.canvas = canvas
+        self.marquee = marquee
+        self.layout = layout
+        c = canvas
+        self.badge = c.create_rectangle(0, 0, 0, 0, outline="", fill=BOARD_BG_COLOR)
+        self.line_text = c.create_text(0, 0, anchor="center", fill=BOARD_FG_COLOR)
+        self.destination_text = c.create_text(0, 0, anchor="w", fill=BOARD_FG_COLOR,
+                                              font=layout.destination_font)
+        self.mask = c.create_rectangle(0, 0, 0, 0, outline="", fill=BOARD_BG_COLOR)
+        self.platform_text = c.create_text(0, 0, anchor="e", fill=BOARD_FG_COLOR,
+                                           font=layout.platform_font)
+        self.time_text = c.create_text(0, 0, anchor="e")
+        self.items = (self.badge, self.line_text, self.destination_text, self.mask,
+                      self.platform_text, self.time_text)
+        self.destination = CanvasText(canvas, self.destination_text)
+
+        self.state = {}
+        self.key = None
+        self.y = None
+        self.visible = False
+        self.departure = None
+        self.style = None
+        self.departure_time = None
+        self.cancelled = False
+
+    def _set(self, name, item, **options):
+        if self.state.get(name) == options:
+            return False
+        self.canvas.itemconfig(item, **options)
+        self.state[name] = options
+        return True
+
+    def place(self, y):
+        """Move the row to y and lay its columns out for the board layout."""
+        c = self.canvas
+        layout = self.layout
+        if not self.visible:
+            for item in self.items:
+                c.itemconfig(item, state="normal")
+            self.visible = True
+        self.y = y
+        middle = y + layout.row_height // 2
+        c.coords(self.badge, 0, y, layout.badge_width, y + layout.row_height)
+        c.coords(self.line_text, layout.badge_width // 2, middle)
+        c.coords(self.destination_text, layout.badge_width + layout.padding, middle + 2)
+        self._place_right_columns()
+
+    def _place_right_columns(self):
+        # Platform sits left of the time, like the packed widget layout
+        c = self.canvas
+        layout = self.layout
+        time_state = self.state.get("time")
+        if time_state is None:
+            # A new row is placed before its first update, which places
+            # these columns once the time is known
+            return
+        y = self.y
+        middle = y + layout.row_height // 2 + 2
+        right = layout.width - layout.padding
+        c.coords(self.time_text, right, middle)
+        left = right - layout.measure(time_state["text"], time_state["font"])
+        platform = self.state.get("platform", {}).get("text")
+        if platform:
+            c.coords(self.platform_text, left - 2 * layout.padding, middle)
+            left -= 2 * layout.padding + layout.measure(platform, layout.platform_font)
+        c.coords(self.mask, left - layout.padding, y, layout.width, y + layout.row_height)
+
+    def apply_layout(self, layout):
+        """Switch the row to the fonts of a new board layout. The board places
+        it again afterwards."""
+        self.layout = layout
+        self.canvas.itemconfig(self.destination_text, font=layout.destination_font)
+        self.canvas.itemconfig(self.platform_text, font=layout.platform_font)
+        self.y = None
+        if self.key is not None:
+            self.update(self.departure, self.style)
+
+    def update(self, departure, style):
+        changed = set()
+        self.departure = departure
+        self.style = style
+        self.departure_time = departure.when
+        self.cancelled = departure.cancelled
+        if self.cancelled:
+            platform_display_text = ""
+        else:
+            platform_display_text = str(departure.platform) if departure.platform else ""
+
+        line_bg = style.get("bg", BOARD_BG_COLOR)
+        self._set("badge", self.badge, fill=line_bg)
+        if self._set("line", self.line_text, text=departure.line, fill=style.get("fg", BOARD_FG_COLOR),
+                     font=self.layout.line_font(style.get("font_size", LINE_FONT_SIZE))):
+            changed.add("line")
+
+        if self._set("destination", self.destination_text, text=departure.destination):
+            self.marquee.unregister(self.destination)
+            changed.add("destination")
+
+        layout_changed = self._set("platform", self.platform_text, text=platform_display_text)
+        layout_changed = self._tick(None) or layout_changed
+        if layout_changed:
+            # The room left for the destination changed
+            changed.add("destination")
+            if self.y is not None:
+                self._place_right_columns()
+        return changed
+
+    def _tick(self, now):
+        if self.cancelled:
+            return self._set("time", self.time_text, text="Fahrt fällt aus", fill="red",
+                             font=self.layout.cancelled_font)
+        return self._set("time", self.time_text, text=format_countdown(self.departure_time, now), fill="white",
+                         font=self.layout.time_font)
+
+    def tick(self, now=None):
+        if self._tick(now) and self.y is not None:
+            self._place_right_columns()
+            self.check_overflow(("destination",))
+
+    def check_overflow(self, changed):
+        """Fit texts into their columns, measured with the layout's fonts."""
+        layout = self.layout
+        if "line" in changed:
+            # A badge cannot clip its text, so shrink the font until it fits
+            line = self.state["line"]
+            font = layout.fit_line_font(line["text"], line["font"])
+            if font != line["font"]:
+                self.canvas.itemconfig(self.line_text, font=font)
+
+        if "destination" in changed:
+            text = self.state["destination"]["text"]
+            time_state = self.state["time"]
+            available = layout.destination_width(time_state["text"], time_state["font"],
+                                                 self.state["platform"]["text"])
+            if layout.measure(text, layout.destination_font) > available:
+                if not self.marquee.is_registered(self.destination):
+                    self.marquee.register(self.destination, self.state["destination"]["text"])
+            else:
+                self._stop_marquee()
+
+    def _stop_marquee(self):
+        if self.marquee.is_registered(self.destination):
+            self.marquee.unregister(self.destination)
+            # Restore the text the marquee has rotated
+            self.canvas.itemconfig(self.destination_text, text=self.state["destination"]["text"])
+
+    def hide(self):
+        self._stop_marquee()
+        # A reused row has to check the overflow again, even for the same text
+        self.state.pop("line", None)
+        self.state.pop("destination", None)
+        for item in self.items:
+            self.canvas.itemconfig(item, state="hidden")
+        self.visible = False
+        self.y = None
+        self.key = None
+        self.departure = None
+        self.style = None
+
+
+class CanvasDepartureBoard(DepartureBoard):
+    """Draws the whole board on one Canvas instead of a tree of Frames and
+    Labels. Rows are items that are moved and reconfigured in place."""
+
+    def __init__(self, content_frame, marquee, line_styles, shares_window=False):
+        # The canvas fills the content frame, so the board's layout follows
+        # the frame; it has to exist before that layout is first applied
+        self.canvas = tk.Canvas(content_frame, bg=BOARD_BG_COLOR, highlightthickness=0, bd=0)
+        self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.message_item = self.canvas.create_text(0, 0, fill="white", justify="center", state="hidden")
+        DepartureBoard.__init__(self, content_frame, marquee, line_styles, shares_window)
+
+    def _layout_message(self):
+        self.canvas.coords(self.message_item, self.layout.width // 2, self.layout.height // 2)
+        self.canvas.itemconfig(self.message_item, width=max(self.layout.width - 40, 1))
+
+    def _new_row(self):
+        return CanvasDepartureRow(self.canvas, self.marquee, self.layout)
+
+    def _hide_message(self):
+        self.canvas.itemconfig(self.message_item, state="hidden")
+
+    def _arrange(self, rows):
+        for index, row in enumerate(rows):
+            y = index * self.layout.row_pitch
+            if row.y != y or not row.visible:
+                row.place(y)
+
+    def show_message(self, text, font):
+        self._hide_rows()
+        self._layout_message()
+        self.canvas.itemconfig(self.message_item, text=text, font=font, state="normal")
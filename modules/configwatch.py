@@ -0,0 +1,55 @@
+import logging
+import os
+
+from modules.utils.luacfgparser import parse_lua_cfg
+
+
+class ConfigWatcher(object):
+    """Polls a config file's modification time and size from a Tk timer and
+    hands every successfully parsed new version to on_change.
+
+    A config that fails to parse, or that on_change rejects by raising, is
+    logged and otherwise ignored, so the running boards stay untouched.
+    """
+
+    def __init__(self, root, path, on_change, interval_ms=2000):
+        self.root = root
+        self.path = path
+        self.on_change = on_change
+        self.interval_ms = interval_ms
+        self.after_id = None
+        self.signature = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        self.after_id = self.root.after(self.interval_ms, self._poll)
+
+    def stop(self):
+        if self.after_id is not None:
+            try:
+                self.root.after_cancel(self.after_id)
+            except Exception:
+                pass
+            self.after_id = None
+
+    def _poll(self):
+        signature = self._signature()
+        if signature is not None and signature != self.signature:
+            self.signature = signature
+            logging.info("Config file {0} changed, reloading".format(self.path))
+            try:
+                config = parse_lua_cfg(self.path)
+            except Exception as e:
+                logging.error("Ignoring invalid config file {0}: {1}".format(self.path, e))
+            else:
+                try:
+                    self.on_change(config)
+                except Exception:
+                    logging.exception("Failed to apply changed config file {0}".format(self.path))
+        self.after_id = self.root.after(self.interval_ms, self._poll)
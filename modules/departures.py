@@ -0,0 +1,361 @@
+import heapq
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+# Fields read from every departure and how to find them when the
+# CustomResponseMapping does not name a path or the path yields nothing.
+DEFAULT_PATHS = {
+    "tripId": ("tripId",),
+    "line": ("line.name",),
+    "destination": ("destination.name",),
+    "time": ("when", "plannedWhen"),
+    "plannedTime": ("plannedWhen",),
+    "delay": ("delay",),
+    "platform": ("platform", "plannedPlatform"),
+    "cancelled": ("cancelled",),
+}
+
+# Arrivals name where a trip comes from instead of where it goes, and the
+# destination column shows that. A CustomResponseMapping overrides it with
+# an origin entry.
+ARRIVAL_PATHS = dict(DEFAULT_PATHS, destination=("origin.name", "provenance"))
+ARRIVAL_MAPPING_KEYS = {"destination": "origin"}
+
+# Values that describe a whole trip, the same in its departure and arrival
+TRIP_FIELDS = ("line", "destination", "origin", "provenance", "direction")
+
+DEFAULT_VALUES = {
+    "line": "N/A",
+    "destination": "N/A",
+    "cancelled": False,
+}
+
+_whitespace_re = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class Departure(namedtuple("Departure", "key trip_id line destination when planned_when delay platform cancelled")):
+    """One departure, normalised from an API response. Times are timezone-aware."""
+    __slots__ = ()
+
+    def seconds_until(self, now):
+        if self.when is None:
+            return None
+        return (self.when - now).total_seconds()
+
+    def sort_key(self, now):
+        # Departures without a time go last, departed ones count as leaving now
+        seconds = self.seconds_until(now)
+        if seconds is None:
+            return float("inf")
+        return max(seconds, 0)
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp such as 2024-05-01T12:34:00+02:00 into an
+    aware datetime. Timestamps without an offset are taken as local time."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+        offset = value[19:]
+        if "." in offset[:1]:
+            # Skip fractional seconds
+            offset = offset.lstrip(".0123456789")
+        if offset in ("Z", "z"):
+            return parsed.replace(tzinfo=timezone.utc)
+        if offset[:1] in ("+", "-") and len(offset) >= 5:
+            digits = offset[1:].replace(":", "")
+            delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:4]))
+            if offset[0] == "-":
+                delta = -delta
+            return parsed.replace(tzinfo=timezone(delta))
+        return parsed.replace(tzinfo=utc_now().astimezone().tzinfo)
+    except ValueError:
+        logging.exception("Failed to parse departure time")
+        return None
+
+
+def _compile_path(path):
+    parts = tuple(path.split("."))
+    if len(parts) == 1:
+        key = parts[0]
+        return lambda raw: raw.get(key)
+
+    def get(raw):
+        current = raw
+        for part in parts:
+            if isinstance(current, dict):
+                current = current.get(part)
+            else:
+                return None
+        return current
+    return get
+
+
+def _compile_field(paths, default):
+    getters = [_compile_path(path) for path in paths]
+    if len(getters) == 1 and default is None:
+        return getters[0]
+
+    def get(raw):
+        for getter in getters:
+            value = getter(raw)
+            if value is not None:
+                return value
+        return default
+    return get
+
+
+def response_key(kind):
+    """The key of the list in a departures or arrivals response."""
+    return "arrivals" if kind == "arrivals" else "departures"
+
+
+def _field_paths(mapping, kind):
+    """Yield (field, default paths, custom path or None) for every field."""
+    mapping = mapping or {}
+    if kind == "arrivals":
+        for field, defaults in ARRIVAL_PATHS.items():
+            yield field, defaults, mapping.get(ARRIVAL_MAPPING_KEYS.get(field, field))
+    else:
+        for field, defaults in DEFAULT_PATHS.items():
+            yield field, defaults, mapping.get(field)
+
+
+def _mapping_paths(mapping, kind="departures"):
+    paths = []
+    for field, defaults, custom in _field_paths(mapping, kind):
+        paths.extend(defaults)
+        if custom:
+            paths.append(custom)
+    return paths
+
+
+def compile_mapping(mapping, kind="departures"):
+    """Turn a CustomResponseMapping table into one accessor function per field.
+
+    Done once when the config is loaded, so rendering never splits paths.
+    For arrivals, the destination field reads the origin of a trip.
+    """
+    accessors = {}
+    for field, defaults, custom in _field_paths(mapping, kind):
+        paths = defaults
+        if custom:
+            paths = (custom,) + tuple(p for p in defaults if p != custom)
+        accessors[field] = _compile_field(paths, DEFAULT_VALUES.get(field))
+    return accessors
+
+
+def response_fields(mapping, kind="departures"):
+    """Return the paths a CustomResponseMapping reads from a departure (or
+    arrival), split into their parts. Paths inside one that is already kept
+    whole are left out."""
+    fields = []
+    for parts in sorted(set(tuple(path.split(".")) for path in _mapping_paths(mapping, kind)), key=len):
+        if not any(parts[:len(kept)] == kept for kept in fields):
+            fields.append(parts)
+    return frozenset(fields)
+
+
+def project_departure(raw, fields):
+    """Copy only the given fields (see response_fields) out of a raw departure."""
+    if not isinstance(raw, dict):
+        return raw
+    projected = {}
+    for parts in fields:
+        value = raw
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            node = projected
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = value
+    return projected
+
+
+class TripCache(object):
+    """Trip values (line, origin, destination) by trip ID.
+
+    The departures and arrivals of a stop list many of the same trips. When
+    a response is decoded, values equal to those already known for the trip
+    are replaced by the known objects, so every trip is held once however
+    many responses mention it. Responses are decoded on worker threads,
+    hence the lock.
+    """
+
+    def __init__(self, max_trips=4096):
+        self.max_trips = max_trips
+        self.lock = threading.Lock()
+        self.trips = OrderedDict()
+
+    def __len__(self):
+        return len(self.trips)
+
+    def share(self, raw):
+        """Replace the trip values of a raw entry by the shared ones."""
+        trip_id = raw.get("tripId") if isinstance(raw, dict) else None
+        if not trip_id:
+            return raw
+        with self.lock:
+            trip = self.trips.get(trip_id)
+            if trip is None:
+                trip = self.trips[trip_id] = {}
+                if len(self.trips) > self.max_trips:
+                    self.trips.popitem(last=False)
+            else:
+                self.trips.move_to_end(trip_id)
+            for field in TRIP_FIELDS:
+                value = raw.get(field)
+                if value is None:
+                    continue
+                shared = trip.get(field)
+                if shared is not None and shared is not value and shared == value:
+                    raw[field] = shared
+                else:
+                    trip[field] = value
+        return raw
+
+
+def _skip_whitespace(text, pos):
+    return _whitespace_re.match(text, pos).end()
+
+
+def _expect(text, pos, char):
+    if not text.startswith(char, pos):
+        raise ValueError("Expecting '{0}' at char {1}".format(char, pos))
+    return _skip_whitespace(text, pos + 1)
+
+
+def _decode_departures(text, pos, fields, trips):
+    """Decode the departures array one entry at a time, keeping only the
+    projected copy of each so the full entries never pile up."""
+    departures = []
+    pos = _expect(text, pos, "[")
+    if text.startswith("]", pos):
+        return departures, pos + 1
+    while True:
+        raw, pos = _decoder.raw_decode(text, pos)
+        raw = project_departure(raw, fields)
+        if trips is not None:
+            raw = trips.share(raw)
+        departures.append(raw)
+        pos = _skip_whitespace(text, pos)
+        if text.startswith("]", pos):
+            return departures, pos + 1
+        pos = _expect(text, pos, ",")
+
+
+def parse_departures_response(text, fields=None, trips=None):
+    """Decode a departures or arrivals response body.
+
+    With fields, every entry is reduced to those fields while the body is
+    being decoded, which keeps large responses (remarks, stopovers) from
+    being held in memory in full. Other top-level values are kept as they are.
+    With trips (a TripCache), trips already known share their values.
+    """
+    pos = _skip_whitespace(text, 0)
+    if fields is None or not text.startswith("{", pos):
+        data = json.loads(text)
+        if trips is not None and isinstance(data, dict):
+            for key in ("departures", "arrivals"):
+                if isinstance(data.get(key), list):
+                    data[key] = [trips.share(raw) for raw in data[key]]
+        return data
+
+    data = {}
+    pos = _expect(text, pos, "{")
+    if text.startswith("}", pos):
+        pos += 1
+    else:
+        while True:
+            key, pos = _decoder.raw_decode(text, pos)
+            if not isinstance(key, str):
+                raise ValueError("Expecting property name at char {0}".format(pos))
+            pos = _expect(text, _skip_whitespace(text, pos), ":")
+            if key in ("departures", "arrivals") and text.startswith("[", pos):
+                data[key], pos = _decode_departures(text, pos, fields, trips)
+            else:
+                data[key], pos = _decoder.raw_decode(text, pos)
+            pos = _skip_whitespace(text, pos)
+            if text.startswith("}", pos):
+                pos += 1
+                break
+            pos = _expect(text, pos, ",")
+    if _skip_whitespace(text, pos) != len(text):
+        raise ValueError("Extra data at char {0}".format(pos))
+    return data
+
+
+def normalize_departure(raw, accessors):
+    if not isinstance(raw, dict):
+        return None
+    line = accessors["line"](raw)
+    destination = accessors["destination"](raw)
+    raw_when = accessors["time"](raw)
+    raw_planned = accessors["plannedTime"](raw)
+    trip_id = accessors["tripId"](raw)
+    key = trip_id or (line, destination, raw_planned or raw_when)
+    when = parse_timestamp(raw_when)
+
+    return Departure(
+        key=key,
+        trip_id=trip_id,
+        line=line,
+        destination=destination,
+        when=when,
+        planned_when=when if raw_planned == raw_when else parse_timestamp(raw_planned),
+        delay=accessors["delay"](raw),
+        platform=accessors["platform"](raw),
+        cancelled=bool(accessors["cancelled"](raw)),
+    )
+
+
+def normalize_departures(raw_departures, accessors):
+    """Normalise a list of raw API departures, skipping malformed entries."""
+    departures = []
+    for raw in raw_departures:
+        departure = normalize_departure(raw, accessors)
+        if departure is not None:
+            departures.append(departure)
+    return departures
+
+
+def select_departures(raw_departures, accessors, count, now, departed_grace=None, departure_filter=None):
+    """Return the count soonest departures, in order.
+
+    Entries are normalised one by one into a bounded heap instead of being
+    collected and sorted in full. With departed_grace, departures that left
+    more than that many seconds ago are skipped. With departure_filter (a
+    filters.DepartureFilter), only the departures it accepts are shown.
+    """
+    def candidates():
+        for raw in raw_departures:
+            departure = normalize_departure(raw, accessors)
+            if departure is None:
+                continue
+            if departed_grace is not None and departure.when is not None:
+                if departure.seconds_until(now) <= -departed_grace:
+                    continue
+            if departure_filter is not None and not departure_filter.accepts(departure, now):
+                continue
+            yield departure
+
+    def sort_key(departure):
+        return departure.sort_key(now)
+
+    if departure_filter is not None and departure_filter.caps_trips():
+        # Which trips are capped depends on the order, so all of them are sorted
+        return departure_filter.limit(sorted(candidates(), key=sort_key), count)
+    return heapq.nsmallest(count, candidates(), key=sort_key)
@@ -0,0 +1,172 @@
+import logging
+import random
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules import metrics
+from modules.departures import TripCache, parse_departures_response
+
+CA_BUNDLE = "cacert.pem"
+RECORD_FILE = "recordings/responses.jsonl"
+
+_max_age_re = re.compile(r"max-age\s*=\s*(\d+)")
+
+
+class FetchError(Exception):
+    pass
+
+
+class DepartureFetcher(object):
+    """Long-lived HTTP client for transport.rest.
+
+    Keeps one requests.Session so connections (and the loaded CA bundle) are
+    reused between polls, sends conditional requests based on ETag and
+    Last-Modified, honours Cache-Control max-age and backs off exponentially
+    with jitter after failures.
+
+    This is the data source the FetchScheduler polls. Other sources (see
+    replay.ReplayFetcher) subclass it and override _get. With a recorder
+    (replay.ResponseRecorder), every response is also recorded.
+    """
+
+    def __init__(self, timeout=10, pool_size=4, backoff_base=5, backoff_max=300, recorder=None):
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.recorder = recorder
+        # Replaced by a seeded random.Random where runs have to repeat
+        self.random = random
+        # Consecutive failures per request, used for the backoff
+        self._failures = {}
+
+        self.session = requests.Session()
+        self.session.verify = CA_BUNDLE
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Per request: last body, validators and the time it stays fresh until
+        self._cache = {}
+        # Shared by the departures and arrivals of every stop
+        self.trips = TripCache()
+
+    def _cache_key(self, url, params):
+        return (url, tuple(sorted((params or {}).items())))
+
+    def fetch(self, url, params=None, fields=None):
+        """Return the decoded JSON body for url. Raises FetchError on failure.
+
+        fields (see departures.response_fields) limits the departures or
+        arrivals in the body to what the boards read."""
+        key = self._cache_key(url, params)
+        cached = self._cache.get(key)
+        if cached is not None and cached["fields"] != fields:
+            # The cached body lacks fields that are needed now
+            cached = None
+
+        if cached is not None and time.time() < cached["fresh_until"]:
+            logging.debug("Response for {0} still fresh, skipping request".format(url))
+            metrics.FETCH_RESPONSES.inc(url=url, status="fresh")
+            return cached["data"]
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        start = time.perf_counter()
+        try:
+            response = self._get(url, params, headers)
+            metrics.FETCH_DURATION.observe(time.perf_counter() - start, url=url)
+            metrics.FETCH_RESPONSES.inc(url=url, status=str(response.status_code))
+            if response.status_code == 304 and cached is not None:
+                logging.debug("Response for {0} not modified".format(url))
+                data = cached["data"]
+            else:
+                response.raise_for_status()
+                data = parse_departures_response(response.content.decode("utf-8"), fields, self.trips)
+        except Exception as e:
+            if getattr(e, "response", None) is None:
+                # No HTTP status to count, e.g. a timeout or an undecodable body
+                metrics.FETCH_RESPONSES.inc(url=url, status="error")
+            self.note_failure(url, params)
+            raise FetchError(str(e))
+
+        self._failures.pop(key, None)
+        self._cache[key] = {
+            "data": data,
+            "fields": fields,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fresh_until": time.time() + self._max_age(response),
+        }
+        return data
+
+    def _get(self, url, params, headers):
+        """Send the request. Returns a requests.Response, or anything with
+        the same status_code, headers, content and raise_for_status."""
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if self.recorder is not None and response.status_code != 304:
+            self.recorder.record(url, params, response)
+        return response
+
+    def _max_age(self, response):
+        cache_control = response.headers.get("Cache-Control", "")
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            return 0
+        match = _max_age_re.search(cache_control)
+        return int(match.group(1)) if match else 0
+
+    def note_failure(self, url, params):
+        """Count a failed request towards the backoff, e.g. one that missed
+        the scheduler's deadline."""
+        key = self._cache_key(url, params)
+        self._failures[key] = self._failures.get(key, 0) + 1
+
+    def next_delay(self, url, params, update_interval):
+        """Seconds to wait before polling url again."""
+        failures = self._failures.get(self._cache_key(url, params), 0)
+        if not failures:
+            return update_interval
+        # Full jitter: uniform between the base interval and the exponential
+        # cap. A failing API is never polled more often than a working one.
+        base = max(update_interval, self.backoff_base)
+        cap = min(self.backoff_max, base * (2 ** failures))
+        return self.random.uniform(base, max(base, cap))
+
+    def forget(self, url, params):
+        """Drop everything remembered about a request nobody polls any more."""
+        key = self._cache_key(url, params)
+        self._cache.pop(key, None)
+        self._failures.pop(key, None)
+
+    def close(self):
+        self.session.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+def create_fetcher(config):
+    """Return the data source dataSource in config asks for: "http" (the
+    API), "record" (the API, recording every response to recordFile) or
+    "replay" (the responses in replayFile)."""
+    source = config.get("dataSource", "http")
+    backoff_max = config.get("maxRetryInterval", 300)
+    if source == "replay":
+        from modules.replay import ReplayFetcher
+        return ReplayFetcher(config.get("replayFile", RECORD_FILE), speed=config.get("replaySpeed", 1.0),
+                             latency=config.get("replayLatency", 0), error_rate=config.get("replayErrorRate", 0),
+                             seed=config.get("replaySeed", 0), backoff_max=backoff_max)
+    recorder = None
+    if source == "record":
+        from modules.replay import ResponseRecorder
+        recorder = ResponseRecorder(config.get("recordFile", RECORD_FILE))
+    elif source != "http":
+        logging.error("Unknown dataSource {0}, using the API".format(source))
+    return DepartureFetcher(backoff_max=backoff_max, recorder=recorder)
@@ -0,0 +1,136 @@
+"""The Filters table of a board: which departures it shows.
+
+    Filters = {
+        lines = { "S1", "S2" },        -- only these lines
+        excludeLines = { "N1" },       -- never these lines
+        platforms = { "1", "2" },      -- only these platforms
+        destinations = { "Spandau" },  -- only destinations containing one of these
+        direction = "900003200",       -- only trips that go on to this stop
+        minLeadTime = 120,             -- hide departures sooner than this (seconds)
+        hideCancelled = true,
+        maxPerLine = 2,                -- at most this many trips per line
+        maxPerDestination = 1,         -- ... and per line and destination
+    }
+
+Filters the departures API understands (direction) are sent with the
+request, so it returns fewer departures. The others are checked on every
+normalised departure before the soonest ones are picked. An empty list
+filters nothing; trips without a platform (or line, or destination) never
+match a list of them.
+"""
+
+# Filters the API applies itself, as config key -> request parameter
+QUERY_FILTERS = {
+    "direction": "direction",
+}
+
+
+def _names(config, key):
+    value = config.get(key)
+    # An empty Lua table parses as a dict; like a missing one it filters nothing
+    if value is None or value == {} or value == []:
+        return None
+    if isinstance(value, (str, int, float)):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError("Filters.{0} must be a name or a list of names".format(key))
+    return [str(item) for item in value]
+
+
+def _count(config, key):
+    value = config.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError("Filters.{0} must be a positive whole number".format(key))
+    return value
+
+
+class DepartureFilter(object):
+    """A compiled Filters table.
+
+    Only the configured checks are kept, so a board without filters pays
+    for one empty loop per departure.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        if not isinstance(config, dict):
+            raise ValueError("Filters must be a table")
+
+        self.params = {}
+        for key, param in QUERY_FILTERS.items():
+            if config.get(key) is not None:
+                self.params[param] = str(config[key])
+
+        self.checks = []
+        lines = _names(config, "lines")
+        if lines is not None:
+            lines = frozenset(lines)
+            self.checks.append(lambda departure, now: departure.line is not None and str(departure.line) in lines)
+        exclude_lines = _names(config, "excludeLines")
+        if exclude_lines is not None:
+            exclude_lines = frozenset(exclude_lines)
+            self.checks.append(lambda departure, now: departure.line is None or
+                               str(departure.line) not in exclude_lines)
+        platforms = _names(config, "platforms")
+        if platforms is not None:
+            platforms = frozenset(platforms)
+            # Trips without a platform are on none of them
+            self.checks.append(lambda departure, now: departure.platform is not None and
+                               str(departure.platform) in platforms)
+        destinations = _names(config, "destinations")
+        if destinations is not None:
+            destinations = [name.lower() for name in destinations]
+            self.checks.append(lambda departure, now: departure.destination is not None and any(
+                name in str(departure.destination).lower() for name in destinations))
+        min_lead_time = config.get("minLeadTime")
+        if min_lead_time:
+            if not isinstance(min_lead_time, (int, float)) or min_lead_time < 0:
+                raise ValueError("Filters.minLeadTime must be a number of seconds")
+            self.checks.append(lambda departure, now: departure.when is None or
+                               departure.seconds_until(now) >= min_lead_time)
+        if config.get("hideCancelled", False):
+            self.checks.append(lambda departure, now: not departure.cancelled)
+
+        self.max_per_line = _count(config, "maxPerLine")
+        self.max_per_destination = _count(config, "maxPerDestination")
+
+    def drops_departures(self):
+        """True if departures the API returns may be left out."""
+        return bool(self.checks) or self.caps_trips()
+
+    def caps_trips(self):
+        return bool(self.max_per_line or self.max_per_destination)
+
+    def query_params(self):
+        """Request parameters for the filters the API applies."""
+        return dict(self.params)
+
+    def accepts(self, departure, now):
+        for check in self.checks:
+            if not check(departure, now):
+                return False
+        return True
+
+    def limit(self, departures, count):
+        """Take up to count departures, in order, capping the trips per line
+        and per destination."""
+        if not self.caps_trips():
+            return departures[:count]
+        shown = []
+        per_line = {}
+        per_destination = {}
+        for departure in departures:
+            line = departure.line
+            destination = (departure.line, departure.destination)
+            if self.max_per_line and per_line.get(line, 0) >= self.max_per_line:
+                continue
+            if self.max_per_destination and per_destination.get(destination, 0) >= self.max_per_destination:
+                continue
+            per_line[line] = per_line.get(line, 0) + 1
+            per_destination[destination] = per_destination.get(destination, 0) + 1
+            shown.append(departure)
+            if len(shown) == count:
+                break
+        return shown
@@ -0,0 +1,425 @@
+"""Append-only history of every departures response, for later analysis.
+
+With historyFolder set, each fresh response of a board is normalised on a
+background thread and appended to one file per day (UTC), e.g.
+history/2024-05-01.nvh. Responses are collected for historyFlushInterval
+seconds and written as one chunk:
+
+    file   := MAGIC chunk*
+    chunk  := header strings columns
+    header := CHUNK_HEADER (magic, byte length after the header, rows,
+              first and last fetch time in ms since the epoch, strings)
+    strings:= uint32 length per string, then the UTF-8 bytes of all of them
+    columns:= one array per column, see COLUMNS
+
+Every string (board, trip ID, line, platform) is stored once per chunk and
+referred to by index. Times are deltas: the fetch time from the chunk's
+first fetch, the planned time from the (whole second of the) fetch and the actual time from the
+planned one (the delay), so they fit into 32 bits.
+
+HistoryReader memory-maps the files and skips chunks outside the asked
+time range by their header alone, so weeks of data can be scanned without
+reading them in full. Run ``novium.py --history`` for a summary.
+
+A chunk cut off by a power failure is cut off the file before the next
+chunk is appended to it, and skipped by the reader.
+"""
+import argparse
+import array
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from modules.departures import normalize_departures
+
+MAGIC = b"NVH1"
+CHUNK_HEADER = struct.Struct("<4sIIqqI")
+CHUNK_MAGIC = b"CHNK"
+NONE = -2 ** 31
+NO_STRING = 2 ** 32 - 1
+
+# Column name, array type code
+COLUMNS = (
+    ("fetched", "I"),  # ms after the chunk's first fetch
+    ("board", "I"),  # string index
+    ("trip", "I"),  # string index
+    ("line", "I"),  # string index
+    ("planned", "i"),  # s after the whole second of the fetch, or NONE
+    ("delay", "i"),  # actual minus planned time in s, or NONE
+    ("platform", "I"),  # string index, or NO_STRING
+    ("cancelled", "B"),
+)
+
+# Bytes per row over all columns
+ROW_SIZE = 7 * 4 + 1
+
+Record = namedtuple("Record", "fetched_at board trip_id line planned actual platform cancelled")
+
+
+def _check_item_sizes():
+    # array item sizes are platform dependent, the format is not
+    for name, code in COLUMNS:
+        expected = 1 if code == "B" else 4
+        if array.array(code).itemsize != expected:
+            raise RuntimeError("array type {0} is not {1} bytes here".format(code, expected))
+
+
+def _day_file(folder, ms):
+    day = datetime.fromtimestamp(ms / 1000.0, timezone.utc).strftime("%Y-%m-%d")
+    return os.path.join(folder, day + ".nvh")
+
+
+def chunk_end(data, pos):
+    """Return where the chunk at pos ends, or None if there is no complete
+    chunk, e.g. one that was cut off by a power failure."""
+    body = pos + CHUNK_HEADER.size
+    if body > len(data):
+        return None
+    magic, length, rows, first_ms, last_ms, count = CHUNK_HEADER.unpack_from(data, pos)
+    end = body + length
+    if magic != CHUNK_MAGIC or end > len(data) or first_ms > last_ms or 4 * count > length:
+        return None
+    lengths = array.array("I")
+    lengths.frombytes(data[body:body + 4 * count])
+    if 4 * count + sum(lengths) + rows * ROW_SIZE != length:
+        return None
+    return end
+
+
+def repair(path):
+    """Cut a history file back to its last complete chunk, so chunks
+    appended later do not end up behind a broken one."""
+    with open(path, "r+b") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(MAGIC):
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError("{0} is not a history file".format(path))
+            pos = len(MAGIC)
+            while pos < size:
+                end = chunk_end(data, pos)
+                if end is None:
+                    break
+                pos = end
+        finally:
+            data.close()
+        if pos < size:
+            logging.warning("Cutting {0} broken bytes off the end of {1}".format(size - pos, path))
+            f.truncate(pos)
+
+
+def encode_chunk(fetches):
+    """Encode [(fetched_at, board, departures)] as one chunk.
+
+    fetched_at is in seconds since the epoch, departures are
+    departures.Departure records."""
+    strings = []
+    indexes = {}
+
+    def intern(value):
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        index = indexes.get(value)
+        if index is None:
+            index = indexes[value] = len(strings)
+            strings.append(value)
+        return index
+
+    columns = dict((name, array.array(code)) for name, code in COLUMNS)
+    first_ms = int(fetches[0][0] * 1000)
+    last_ms = first_ms
+    for fetched_at, board, departures in fetches:
+        fetched_ms = int(fetched_at * 1000)
+        last_ms = max(last_ms, fetched_ms)
+        board_index = intern(board)
+        for departure in departures:
+            planned = departure.planned_when or departure.when
+            columns["fetched"].append(fetched_ms - first_ms)
+            columns["board"].append(board_index)
+            columns["trip"].append(intern(departure.trip_id))
+            columns["line"].append(intern(departure.line))
+            if planned is None:
+                columns["planned"].append(NONE)
+                columns["delay"].append(NONE)
+            else:
+                columns["planned"].append(int(planned.timestamp()) - fetched_ms // 1000)
+                if departure.when is None:
+                    columns["delay"].append(NONE)
+                else:
+                    columns["delay"].append(int((departure.when - planned).total_seconds()))
+            columns["platform"].append(intern(departure.platform))
+            columns["cancelled"].append(1 if departure.cancelled else 0)
+
+    encoded = [text.encode("utf-8") for text in strings]
+    body = [array.array("I", [len(data) for data in encoded]).tobytes(), b"".join(encoded)]
+    body.extend(columns[name].tobytes() for name, _ in COLUMNS)
+    body = b"".join(body)
+    rows = len(columns["fetched"])
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, len(body), rows, first_ms, last_ms, len(strings)) + body
+
+
+class HistoryWriter(object):
+    """Normalises and appends responses on a background thread.
+
+    append() only puts the raw response on a queue, so it costs the Tk
+    thread next to nothing.
+    """
+
+    def __init__(self, folder, flush_interval=60, max_rows=50000):
+        _check_item_sizes()
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.queue = queue.Queue()
+        self.thread = None
+        self.repaired = set()  # files checked for broken chunks since the start
+
+    def start(self):
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self.thread = threading.Thread(target=self._run, name="HistoryWriter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write what is pending and stop the thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(10)
+            self.thread = None
+
+    def append(self, fetched_at, board, raw_departures, accessors):
+        self.queue.put((fetched_at, board, raw_departures, accessors))
+
+    def _run(self):
+        pending = []
+        rows = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.time(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item:
+                fetched_at, board, raw_departures, accessors = item
+                try:
+                    departures = normalize_departures(raw_departures, accessors)
+                except Exception:
+                    logging.exception("Failed to normalise departures for the history")
+                    departures = []
+                pending.append((fetched_at, board, departures))
+                rows += len(departures)
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+            # Write on stop, when the flush interval is over or the chunk is full
+            if pending and (not item or rows >= self.max_rows):
+                self._write(pending)
+                pending = []
+                rows = 0
+                deadline = None
+            if item is None:
+                return
+
+    def _write(self, fetches):
+        # A chunk goes into the file of the day of its first fetch
+        path = _day_file(self.folder, int(fetches[0][0] * 1000))
+        try:
+            if path not in self.repaired and os.path.exists(path):
+                repair(path)
+            self.repaired.add(path)
+            chunk = encode_chunk(fetches)
+            with open(path, "ab") as f:
+                size = f.tell()
+                try:
+                    if size == 0:
+                        f.write(MAGIC)
+                    f.write(chunk)
+                    f.flush()
+                except Exception:
+                    # E.g. a full disk, do not leave half a chunk behind
+                    f.truncate(size)
+                    raise
+            logging.debug("Wrote {0} responses to {1}".format(len(fetches), path))
+        except Exception:
+            logging.exception("Failed to write the history to {0}".format(path))
+
+
+class Chunk(object):
+    """The decoded columns of one chunk. Columns are arrays, strings are
+    referred to by index into strings."""
+
+    def __init__(self, first_ms, last_ms, strings, columns):
+        self.first_ms = first_ms
+        self.last_ms = last_ms
+        self.strings = strings
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["fetched"])
+
+    def string(self, index):
+        return None if index == NO_STRING else self.strings[index]
+
+    def records(self):
+        strings = self.strings
+        c = self.columns
+        for row in range(len(self)):
+            fetched_ms = self.first_ms + c["fetched"][row]
+            planned = actual = None
+            if c["planned"][row] != NONE:
+                planned = fetched_ms // 1000 + c["planned"][row]
+                if c["delay"][row] != NONE:
+                    actual = planned + c["delay"][row]
+            yield Record(fetched_ms / 1000.0, strings[c["board"][row]], self.string(c["trip"][row]),
+                         self.string(c["line"][row]), planned, actual, self.string(c["platform"][row]),
+                         bool(c["cancelled"][row]))
+
+
+class HistoryReader(object):
+    """Scans the history files in a folder through memory maps."""
+
+    def __init__(self, folder):
+        _check_item_sizes()
+        self.folder = folder
+
+    def files(self, start=None, end=None):
+        """The day files that may hold fetches between start and end
+        (seconds since the epoch), oldest first."""
+        if not os.path.isdir(self.folder):
+            return []
+        first = _day_file("", int(start * 1000)) if start is not None else None
+        last = _day_file("", int(end * 1000)) if end is not None else None
+        names = []
+        for name in sorted(os.listdir(self.folder)):
+            if not name.endswith(".nvh"):
+                continue
+            if (first is not None and name < first) or (last is not None and name > last):
+                continue
+            names.append(os.path.join(self.folder, name))
+        return names
+
+    def chunks(self, start=None, end=None):
+        """Yield the chunks with fetches between start and end. Other chunks
+        are skipped by their header, without touching their data."""
+        start_ms = None if start is None else int(start * 1000)
+        end_ms = None if end is None else int(end * 1000)
+        for path in self.files(start, end):
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size <= len(MAGIC):
+                    continue
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for chunk in self._read_chunks(path, data, start_ms, end_ms):
+                        yield chunk
+                finally:
+                    data.close()
+
+    def _read_chunks(self, path, data, start_ms, end_ms):
+        if data[:len(MAGIC)] != MAGIC:
+            logging.warning("{0} is not a history file".format(path))
+            return
+        pos = len(MAGIC)
+        while pos + CHUNK_HEADER.size <= len(data):
+            end = chunk_end(data, pos)
+            if end is None:
+                # E.g. a chunk that was cut off by a power failure, go on
+                # with the next complete one
+                resync = data.find(CHUNK_MAGIC, pos + 1)
+                logging.warning("Skipping a broken chunk in {0}".format(path))
+                if resync < 0:
+                    return
+                pos = resync
+                continue
+            _, _, rows, first_ms, last_ms, count = CHUNK_HEADER.unpack_from(data, pos)
+            body = pos + CHUNK_HEADER.size
+            pos = end
+            if (start_ms is not None and last_ms < start_ms) or (end_ms is not None and first_ms > end_ms):
+                continue
+            yield self._decode(data, body, rows, first_ms, last_ms, count)
+
+    def _decode(self, data, pos, rows, first_ms, last_ms, count):
+        view = memoryview(data)
+        try:
+            lengths = array.array("I")
+            lengths.frombytes(view[pos:pos + 4 * count])
+            pos += 4 * count
+            strings = []
+            for length in lengths:
+                strings.append(bytes(view[pos:pos + length]).decode("utf-8"))
+                pos += length
+            columns = {}
+            for name, code in COLUMNS:
+                column = array.array(code)
+                size = column.itemsize * rows
+                column.frombytes(view[pos:pos + size])
+                pos += size
+                columns[name] = column
+        finally:
+            view.release()
+        return Chunk(first_ms, last_ms, strings, columns)
+
+    def records(self, start=None, end=None, board=None):
+        """Yield every Record fetched between start and end, optionally only
+        those of one board."""
+        for chunk in self.chunks(start, end):
+            for record in chunk.records():
+                if start is not None and record.fetched_at < start:
+                    continue
+                if end is not None and record.fetched_at > end:
+                    continue
+                if board is not None and record.board != board:
+                    continue
+                yield record
+
+
+def main(argv, config_file="novium.cfg"):
+    from modules.utils.luacfgparser import parse_lua_cfg
+
+    parser = argparse.ArgumentParser(prog="novium.py --history", description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default=None, help="history folder (default: historyFolder from the config)")
+    parser.add_argument("--days", type=float, default=7, help="summarise this many days back")
+    parser.add_argument("--board", default=None)
+    parser.add_argument("--config", default=config_file)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    folder = args.folder or parse_lua_cfg(args.config).get("historyFolder") or "history"
+    start = time.time() - args.days * 86400
+
+    started = time.perf_counter()
+    rows = 0
+    cancelled = 0
+    delays = {}  # line -> [sum of delays, count]
+    for chunk in HistoryReader(folder).chunks(start):
+        c = chunk.columns
+        first_ms = chunk.first_ms
+        board = None
+        if args.board is not None:
+            board = chunk.strings.index(args.board) if args.board in chunk.strings else -1
+        for row in range(len(chunk)):
+            if first_ms + c["fetched"][row] < start * 1000 or (board is not None and c["board"][row] != board):
+                continue
+            rows += 1
+            cancelled += c["cancelled"][row]
+            if c["delay"][row] != NONE:
+                line = chunk.strings[c["line"][row]]
+                total = delays.setdefault(line, [0, 0])
+                total[0] += c["delay"][row]
+                total[1] += 1
+
+    sys.stdout.write("{0} departures seen in the last {1:g} days, {2} of them cancelled ({3:.2f} s)\n".format(
+        rows, args.days, cancelled, time.perf_counter() - started))
+    for line, (total, count) in sorted(delays.items(), key=lambda item: -item[1][0] / item[1][1])[:20]:
+        sys.stdout.write("{0:>10}  {1:6.1f} min average delay over {2} sightings\n".format(
+            line, total / count / 60.0, count))
+    return 0
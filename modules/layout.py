@@ -0,0 +1,109 @@
+import collections
+import tkinter.font as tkfont
+
+# The board is designed for a 1024x768 screen and scaled from there
+BASE_WIDTH = 1024
+BASE_HEIGHT = 768
+HEADER_HEIGHT = 80
+
+ROW_HEIGHT = 60
+ROW_GAP = 2
+LINE_BADGE_WIDTH = 100
+LINE_PADDING = 5
+PADDING = 20
+FONT_SIZE = 24
+LINE_FONT_SIZE = 27
+MIN_FONT_SIZE = 8
+
+REGULAR_FONT = "DB Neo Screen Sans Regular"
+BOLD_FONT = "DB Neo Screen Sans Bold"
+
+
+class TextMeasurer(object):
+    """Measures text widths with tkinter.font, remembering the result per
+    font and string. Measuring never waits for a layout pass."""
+
+    def __init__(self, root, max_entries=4096):
+        self.root = root
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.widths = collections.OrderedDict()
+
+    def measure(self, text, font):
+        key = (font, text)
+        width = self.widths.get(key)
+        if width is not None:
+            self.widths.move_to_end(key)
+            return width
+
+        font_object = self.fonts.get(font)
+        if font_object is None:
+            font_object = self.fonts[font] = tkfont.Font(root=self.root, font=font)
+        width = self.widths[key] = font_object.measure(text)
+        if len(self.widths) > self.max_entries:
+            self.widths.popitem(last=False)
+        return width
+
+
+class Layout(object):
+    """Row geometry and fonts for a board content area of width x height
+    pixels, computed once per size and shared by every row.
+
+    A content area that shares its window with others (the sections of a
+    combined board) passes window_height: fonts and rows then scale with the
+    window, and the area's own height only limits how many rows fit.
+    """
+
+    def __init__(self, width, height, measurer=None, window_height=None):
+        self.width = width
+        self.height = height
+        self.measurer = measurer
+        if window_height is None:
+            self.scale = min(width / BASE_WIDTH, height / (BASE_HEIGHT - HEADER_HEIGHT))
+        else:
+            self.scale = min(width / BASE_WIDTH, window_height / BASE_HEIGHT)
+
+        self.row_height = max(int(ROW_HEIGHT * self.scale), 1)
+        self.row_pitch = self.row_height + ROW_GAP
+        self.max_rows = max(height // self.row_pitch, 1)
+        self.badge_width = int(LINE_BADGE_WIDTH * self.scale)
+        self.padding = int(PADDING * self.scale)
+
+        size = self.font_size(FONT_SIZE)
+        self.destination_font = (REGULAR_FONT, size, "")
+        self.platform_font = (BOLD_FONT, size)
+        self.time_font = (REGULAR_FONT, size, "normal")
+        self.cancelled_font = (REGULAR_FONT, size, "bold")
+
+    def font_size(self, size):
+        return max(int(round(size * self.scale)), MIN_FONT_SIZE)
+
+    def line_font(self, size=LINE_FONT_SIZE):
+        return (BOLD_FONT, self.font_size(size), "bold")
+
+    def measure(self, text, font):
+        return self.measurer.measure(text, font)
+
+    def line_fits(self, text, font):
+        return self.measure(text, font) <= self.badge_width - 2 * LINE_PADDING
+
+    def fit_line_font(self, text, font):
+        """Shrink a line font until the text fits into the badge."""
+        size = font[1]
+        while size > MIN_FONT_SIZE and not self.line_fits(text, (font[0], size, font[2])):
+            size -= 2
+        return (font[0], size, font[2])
+
+    def destination_width(self, time_text, time_font, platform_text):
+        """Width left for the destination next to the time and platform columns."""
+        width = self.width - self.badge_width - 4 * self.padding - self.measure(time_text, time_font)
+        if platform_text:
+            width -= self.measure(platform_text, self.platform_font) + 2 * self.padding
+        return width
+
+
+def estimate_max_rows(width, height):
+    """Rows that fit into a window of width x height before it is laid out,
+    going by the header height of the base design."""
+    scale = min(width / BASE_WIDTH, height / BASE_HEIGHT)
+    return Layout(width, height - int(HEADER_HEIGHT * scale)).max_rows
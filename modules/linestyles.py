@@ -0,0 +1,69 @@
+import logging
+from collections import OrderedDict
+
+DEFAULT_STYLE = {"bg": "#122080", "fg": "white", "font_size": 27}
+
+
+def _resolve(cfg):
+    return {
+        "bg": cfg.get("bg", DEFAULT_STYLE["bg"]),
+        "fg": cfg.get("fg", DEFAULT_STYLE["fg"]),
+        "font_size": cfg.get("font_size", DEFAULT_STYLE["font_size"]),
+    }
+
+
+class LineStyleMatcher(object):
+    """Looks up the LineStyles entry for a line name.
+
+    The config is compiled once: every style is resolved against the default,
+    and the keys are ordered longest first (so 'ICE' is checked before 'IC').
+    Results are remembered per line name in a bounded LRU cache, so the
+    substring scan runs once per distinct line instead of once per row.
+
+    Returned style dicts are shared and must not be modified.
+    """
+
+    def __init__(self, styles_config, cache_size=256):
+        styles_config = styles_config or {}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._three_digit = None
+        if "3DIGIT" in styles_config:
+            self._three_digit = _resolve(styles_config["3DIGIT"])
+        self._styles = [(key, _resolve(styles_config[key]))
+                        for key in sorted(styles_config, key=len, reverse=True)
+                        if key != "3DIGIT"]
+        self._default = dict(DEFAULT_STYLE)
+
+    def match(self, line_name):
+        line_name = str(line_name)
+        style = self._cache.get(line_name)
+        if style is not None:
+            self._cache.move_to_end(line_name)
+            return style
+
+        style = self._lookup(line_name)
+        self._cache[line_name] = style
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return style
+
+    def _lookup(self, line_name):
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+        # Match exact 3-digit number
+        if self._three_digit is not None and line_name.isdigit() and len(line_name) == 3:
+            if debug:
+                logging.debug("Line '{0}' matched 3DIGIT style: {1}".format(line_name, self._three_digit))
+            return self._three_digit
+
+        for key, style in self._styles:
+            if key in line_name:
+                if debug:
+                    logging.debug("Line '{0}' matched style '{1}': {2}".format(line_name, key, style))
+                return style
+
+        # No match
+        if debug:
+            logging.debug("Line '{0}' did not match any style. Using default: {1}".format(line_name, self._default))
+        return self._default
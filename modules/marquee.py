@@ -0,0 +1,61 @@
+import logging
+
+
+class MarqueeDriver(object):
+    """Scrolls every overflowing label from a single Tk timer.
+
+    The rotated texts of a label are computed once when it is registered, so
+    a tick is only one config() call per label. The timer only runs while at
+    least one marquee is registered.
+    """
+
+    def __init__(self, root, delay=150, gap="    "):
+        self.root = root
+        self.delay = delay
+        self.gap = gap
+        self.after_id = None
+        self._marquees = {}  # label -> [frames, position]
+
+    def register(self, label, text):
+        """Start scrolling text in label, replacing any previous marquee."""
+        full_text = text + self.gap  # Add spaces for smooth scrolling
+        frames = [full_text[pos:] + full_text[:pos] for pos in range(len(full_text))]
+        self._marquees[label] = [frames, 0]
+        label.config(text=frames[0])
+        if self.after_id is None:
+            self.after_id = self.root.after(self.delay, self._tick)
+
+    def unregister(self, label):
+        self._marquees.pop(label, None)
+        if not self._marquees:
+            self.stop()
+
+    def is_registered(self, label):
+        return label in self._marquees
+
+    def stop(self):
+        if self.after_id is not None:
+            try:
+                self.root.after_cancel(self.after_id)
+            except Exception:
+                pass
+            self.after_id = None
+
+    def _tick(self):
+        self.after_id = None
+        for label, marquee in list(self._marquees.items()):
+            try:
+                if not label.winfo_exists():
+                    del self._marquees[label]  # widget destroyed
+                    continue
+                frames = marquee[0]
+                marquee[1] = (marquee[1] + 1) % len(frames)
+                label.config(text=frames[marquee[1]])
+            except Exception:
+                logging.exception("Error scrolling marquee")
+                self._marquees.pop(label, None)
+        if self._marquees:
+            self.after_id = self.root.after(self.delay, self._tick)
+
+    def __len__(self):
+        return len(self._marquees)
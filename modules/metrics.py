@@ -0,0 +1,237 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+Metrics are always collected (an update is a dict write under a lock) and
+can be served over HTTP with metricsserver.MetricsServer, e.g. to be
+scraped by Prometheus.
+"""
+import os
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    escaped = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append("{0}=\"{1}\"".format(name, value))
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """A named metric whose values are kept per set of labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels))
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+    def remove(self, **labels):
+        with self.lock:
+            self.values.pop(self._key(labels), None)
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.help_text),
+                 "# TYPE {0} {1}".format(self.name, self.kind)]
+        for labels, value in sorted(self.items()):
+            lines.append("{0}{1} {2}".format(self.name, _format_labels(labels), _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help_text)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per bucket counts, sum, count
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.help_text),
+                 "# TYPE {0} {1}".format(self.name, self.kind)]
+        for labels, (counts, total, count) in sorted(self.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append("{0}_bucket{1} {2}".format(
+                    self.name, _format_labels(labels, ("le", _format_value(float(bound)))), cumulative))
+            lines.append("{0}_sum{1} {2}".format(self.name, _format_labels(labels), repr(total)))
+            lines.append("{0}_count{1} {2}".format(self.name, _format_labels(labels), count))
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+FETCH_DURATION = REGISTRY.histogram(
+    "novium_fetch_duration_seconds", "Time taken by departure requests.")
+FETCH_RESPONSES = REGISTRY.counter(
+    "novium_fetch_responses_total", "Departure requests by HTTP status (or error/fresh).")
+CACHE_AGE = REGISTRY.gauge(
+    "novium_cache_age_seconds", "Age of the departures shown, 0 unless they come from the cache.")
+RENDER_DURATION = REGISTRY.histogram(
+    "novium_render_duration_seconds", "Time taken to render fetched departures onto a board.")
+ROWS_RENDERED = REGISTRY.gauge(
+    "novium_rows_rendered", "Departure rows shown on a board.")
+BOARD_ERROR = REGISTRY.gauge(
+    "novium_board_error", "1 while fetching the departures of a board fails.")
+LAST_UPDATE = REGISTRY.gauge(
+    "novium_board_last_update_timestamp_seconds", "When a board last got a new response.")
+TK_WIDGETS = REGISTRY.gauge(
+    "novium_tk_widgets", "Tk widgets in the widget tree.")
+TK_TIMERS = REGISTRY.gauge(
+    "novium_tk_after_timers", "Pending Tk after timers.")
+MARQUEES = REGISTRY.gauge(
+    "novium_marquees", "Scrolling destination texts.")
+RESIDENT_MEMORY = REGISTRY.gauge(
+    "novium_resident_memory_bytes", "Resident memory of the process.")
+
+
+def count_widgets(widget):
+    count = 1
+    for child in widget.winfo_children():
+        count += count_widgets(child)
+    return count
+
+
+_memory_counters = []
+
+
+def _windows_working_set():
+    # ctypes is only imported once memory is sampled, not at startup
+    import ctypes
+
+    if not _memory_counters:
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.c_ulong),
+                ("PageFaultCount", ctypes.c_ulong),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+        _memory_counters.append(ProcessMemoryCounters)
+    counters = _memory_counters[0]()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return counters.WorkingSetSize
+    return None
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, or None if unknown."""
+    try:
+        if sys.platform == "win32":
+            return _windows_working_set()
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+def sample_tk(root, marquee):
+    """Update the gauges that can only be read on the Tk thread."""
+    TK_WIDGETS.set(count_widgets(root))
+    TK_TIMERS.set(len(root.tk.splitlist(root.tk.call("after", "info"))))
+    MARQUEES.set(len(marquee))
+    rss = resident_memory()
+    if rss is not None:
+        RESIDENT_MEMORY.set(rss)
+
+
+def health(max_age):
+    """Return (healthy, reason) from the board gauges."""
+    for labels, value in BOARD_ERROR.items():
+        if value:
+            return False, "fetching the departures of board {0} fails".format(dict(labels).get("board"))
+    now = time.time()
+    for labels, value in LAST_UPDATE.items():
+        if now - value > max_age:
+            return False, "board {0} not updated for {1:.0f} s".format(dict(labels).get("board"), now - value)
+    return True, "ok"
@@ -0,0 +1,57 @@
+"""HTTP endpoint for the metrics. /metrics returns every metric, /health
+returns 503 while a board shows the error screen or has not been updated
+for too long.
+
+Kept apart from modules.metrics so http.server is only imported when the
+endpoint is enabled.
+"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from modules.metrics import REGISTRY, health
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._send(200, REGISTRY.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/health":
+            healthy, reason = health(self.server.max_age)
+            self._send(200 if healthy else 503, reason + "\n", "text/plain; charset=utf-8")
+        else:
+            self._send(404, "Not found\n", "text/plain; charset=utf-8")
+
+    def _send(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Metrics request: " + format % args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Serves /metrics and /health from a background thread."""
+
+    def __init__(self, port, host="", max_age=900):
+        self.server = _Server((host, port), _Handler)
+        self.server.max_age = max_age
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logging.info("Serving metrics on port {0}".format(self.server.server_address[1]))
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,274 @@
+"""Headless proxy that lets many signs share one API poll per stop.
+
+Run with ``novium.py --serve [options]`` and point the ``reqBaseUrl`` of the
+signs at it, e.g. ``http://proxy:8080/stops/{stopId}/departures?...``.
+Departures and arrivals of a stop (``/stops/<id>/departures`` and
+``/stops/<id>/arrivals``) with the options of the transport.rest API are
+passed on to the upstream API unchanged; other requests get a 404 or 400.
+Every distinct request is polled once by the FetchScheduler, up to
+max_queries of them, and the signs get a compact snapshot that only holds
+the departure (or arrival) fields Novium reads.
+
+The proxy listens on 127.0.0.1 unless --host says otherwise, e.g.
+``--host 0.0.0.0`` to serve signs on other machines.
+
+Responses carry an ETag, so a sign that asks again with If-None-Match gets a
+304 until the departures change. A client that also sends ``Prefer: wait=N``
+is held for up to N seconds until there is a newer snapshot (long polling).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlsplit
+
+from modules.departures import response_fields
+from modules.fetcher import create_fetcher
+from modules.scheduler import FetchScheduler
+from modules.utils.luacfgparser import parse_lua_cfg
+
+DEFAULT_UPSTREAM = "https://v6.vbb.transport.rest"
+MAX_WAIT = 60
+
+# Query parameters of the departures and arrivals endpoints
+QUERY_PARAMS = frozenset((
+    "when", "direction", "duration", "results", "linesOfStops", "remarks", "language",
+    "includeRelatedStations", "stopovers", "suburban", "subway", "tram", "bus", "ferry",
+    "express", "regional", "pretty",
+))
+
+_wait_re = re.compile(r"wait\s*=\s*(\d+)")
+_path_re = re.compile(r"^/stops/[A-Za-z0-9:_.-]{1,64}/(departures|arrivals)/?$")
+
+
+class TooManyQueries(Exception):
+    pass
+
+
+def check_request(path, params):
+    """Return (status, message) if the proxy does not pass a request on,
+    otherwise None."""
+    if not _path_re.match(path):
+        return 404, "Only /stops/<id>/departures and /stops/<id>/arrivals are served"
+    unknown = sorted(set(params) - QUERY_PARAMS)
+    if unknown:
+        return 400, "Unknown parameter(s): {0}".format(", ".join(unknown))
+    return None
+
+
+class Snapshot(object):
+    """One encoded response, shared by every client of a query."""
+
+    def __init__(self, data):
+        self.updated = time.time()
+        if "error" in data:
+            self.status = 502
+        else:
+            self.status = 200
+        self.body = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.gzipped = gzip.compress(self.body)
+        self.etag = '"{0}"'.format(hashlib.sha1(self.body).hexdigest())
+
+
+class DepartureProxy(object):
+    """Polls every query clients ask for and keeps the latest snapshot of it.
+
+    Queries nobody asked for within idle_timeout seconds stop being polled,
+    and at most max_queries are polled at a time. fields maps "departures"
+    and "arrivals" to the fields kept of each.
+    """
+
+    def __init__(self, scheduler, upstream, update_interval=60, fields=None, idle_timeout=600, max_queries=100):
+        self.scheduler = scheduler
+        self.upstream = upstream.rstrip("/")
+        self.update_interval = update_interval
+        self.fields = fields
+        self.idle_timeout = idle_timeout
+        self.max_queries = max_queries
+        self.condition = threading.Condition()
+        # (url, params) key -> {"snapshot", "last_access", "callback"}
+        self.polls = {}
+
+    def start(self):
+        self.scheduler.start()
+        self.scheduler.call_soon(self._expire)
+
+    def stop(self):
+        self.scheduler.stop()
+
+    def get(self, path, params, timeout):
+        """Return the current snapshot for a query, starting to poll it if
+        needed. Returns None if there is no snapshot after timeout seconds,
+        raises TooManyQueries if max_queries are polled already."""
+        url = self.upstream + path
+        key = (url, tuple(sorted(params.items())))
+        with self.condition:
+            poll = self.polls.get(key)
+            if poll is None:
+                if len(self.polls) >= self.max_queries:
+                    raise TooManyQueries()
+                logging.info("Starting to poll {0} with params {1}".format(url, params))
+                poll = {"snapshot": None}
+                poll["callback"] = lambda data, stale: self._update(key, data)
+                self.polls[key] = poll
+                kind = "arrivals" if path.rstrip("/").endswith("/arrivals") else "departures"
+                self.scheduler.call_soon(self.scheduler.subscribe, url, params, self.update_interval,
+                                         poll["callback"], (self.fields or {}).get(kind))
+            poll["last_access"] = time.time()
+            self.condition.wait_for(lambda: poll["snapshot"] is not None, timeout)
+            return poll["snapshot"]
+
+    def wait_for_change(self, snapshot, path, params, timeout):
+        """Block until the query has a snapshot other than snapshot."""
+        key = (self.upstream + path, tuple(sorted(params.items())))
+        with self.condition:
+            poll = self.polls.get(key)
+            if poll is None:
+                return snapshot
+            self.condition.wait_for(lambda: poll["snapshot"] is not snapshot, timeout)
+            return poll["snapshot"]
+
+    def _update(self, key, data):
+        # Called on the scheduler's event loop thread
+        snapshot = Snapshot(data)
+        with self.condition:
+            poll = self.polls.get(key)
+            if poll is None:
+                return
+            if poll["snapshot"] is None or poll["snapshot"].etag != snapshot.etag:
+                poll["snapshot"] = snapshot
+                self.condition.notify_all()
+            else:
+                # Same departures, only note that they are current
+                poll["snapshot"].updated = snapshot.updated
+
+    def _expire(self):
+        # Runs on the event loop thread, like subscribe and unsubscribe
+        now = time.time()
+        with self.condition:
+            idle = [(key, poll) for key, poll in self.polls.items()
+                    if now - poll["last_access"] > self.idle_timeout]
+            for key, poll in idle:
+                del self.polls[key]
+        for key, poll in idle:
+            logging.info("No client asked for {0} recently, no longer polling it".format(key[0]))
+            self.scheduler.unsubscribe(key[0], dict(key[1]), poll["callback"])
+        self.scheduler.loop.call_later(60, self._expire)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        proxy = self.server.proxy
+
+        rejected = check_request(parts.path, params)
+        if rejected is not None:
+            self._send_error(*rejected)
+            return
+        try:
+            snapshot = proxy.get(parts.path, params, proxy.scheduler.deadline)
+        except TooManyQueries:
+            self._send_error(503, "Already polling {0} queries".format(proxy.max_queries))
+            return
+        if snapshot is None:
+            self._send_error(504, "No response from the upstream API yet")
+            return
+
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match == snapshot.etag:
+            match = _wait_re.search(self.headers.get("Prefer", ""))
+            if match:
+                snapshot = proxy.wait_for_change(snapshot, parts.path, params, min(int(match.group(1)), MAX_WAIT))
+            if if_none_match == snapshot.etag:
+                self.send_response(304)
+                self.send_header("ETag", snapshot.etag)
+                self.end_headers()
+                return
+
+        gzip_ok = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = snapshot.gzipped if gzip_ok else snapshot.body
+        self.send_response(snapshot.status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", snapshot.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Last-Modified", self.date_time_string(snapshot.updated))
+        if gzip_ok:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("{0} {1}".format(self.address_string(), format % args))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main(argv, config_file="novium.cfg"):
+    parser = argparse.ArgumentParser(prog="novium.py --serve", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1, 0.0.0.0 for all)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-queries", type=int, default=100, help="most queries polled at a time")
+    parser.add_argument("--upstream", default=None,
+                        help="API to poll (default: serveUpstream from the config, or {0})".format(DEFAULT_UPSTREAM))
+    parser.add_argument("--config", default=config_file)
+    parser.add_argument("--record", metavar="FILE", help="record every upstream response to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="serve the responses recorded in FILE instead")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed (default: replaySpeed or 1)")
+    parser.add_argument("--latency", type=float, default=None, help="seconds added to every replayed response")
+    parser.add_argument("--error-rate", type=float, default=None,
+                        help="share of replayed requests that fail with a 503")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the replayed errors and backoff")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    config = parse_lua_cfg(args.config)
+    if args.replay:
+        config.update(dataSource="replay", replayFile=args.replay)
+    elif args.record:
+        config.update(dataSource="record", recordFile=args.record)
+    for key, value in (("replaySpeed", args.speed), ("replayLatency", args.latency),
+                       ("replayErrorRate", args.error_rate), ("replaySeed", args.seed)):
+        if value is not None:
+            config[key] = value
+
+    fetcher = create_fetcher(config)
+    scheduler = FetchScheduler(None, fetcher, max_workers=config.get("maxFetchWorkers", 4),
+                               deadline=config.get("fetchDeadline", 20))
+    proxy = DepartureProxy(scheduler, args.upstream or config.get("serveUpstream", DEFAULT_UPSTREAM),
+                           update_interval=config.get("updateInterval", 60), max_queries=args.max_queries,
+                           fields=dict((kind, response_fields(config.get("CustomResponseMapping", {}), kind))
+                                       for kind in ("departures", "arrivals")))
+
+    server = _Server((args.host, args.port), _Handler)
+    server.proxy = proxy
+    proxy.start()
+    logging.info("Serving departures from {0} on {1}:{2}".format(proxy.upstream, *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        proxy.stop()
+        fetcher.close()
+    return 0
@@ -0,0 +1,190 @@
+"""Recorded API responses, for load tests and offline development.
+
+With dataSource = "record", every response of the departures API is
+appended to recordFile as one JSON line, together with the time it came in.
+With dataSource = "replay", a ReplayFetcher answers from such a file instead
+of the network. Every query gets the response that was current at the same
+point of the recording. The recording is played back replaySpeed times as
+fast (and starts over at its end), each response comes after replayLatency
+seconds, and a share of replayErrorRate of the requests fail with an HTTP
+503. Caching, ETags and the backoff after failures work just as with the API.
+
+``novium.py --serve --replay FILE`` serves a recording over HTTP, so many
+signs (or boards in a load test) can use it as their API.
+"""
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from modules.fetcher import DepartureFetcher
+
+RECORDED_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+def request_key(url, params):
+    """Key a request by path and all of its parameters, wherever they are
+    given, so a recording can be replayed against another host (e.g. the
+    --serve proxy)."""
+    parts = urlsplit(url)
+    merged = dict(parse_qsl(parts.query, keep_blank_values=True))
+    merged.update((key, str(value)) for key, value in (params or {}).items())
+    return parts.path, tuple(sorted(merged.items()))
+
+
+class ResponseRecorder(object):
+    """Appends responses to a JSON lines file. Responses come in on the
+    worker threads of the scheduler, hence the lock."""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+        logging.info("Recording API responses to {0}".format(path))
+
+    def record(self, url, params, response):
+        entry = {
+            "time": time.time(),
+            "url": url,
+            "params": params or {},
+            "status": response.status_code,
+            "headers": dict((name, response.headers[name]) for name in RECORDED_HEADERS if name in response.headers),
+            "body": response.content.decode("utf-8", "replace"),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line + "\n")
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def load_recording(path):
+    """Return the responses in a recording as {request key: (times, entries)},
+    sorted by time."""
+    recorded = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # E.g. the last line of a recording that was cut off
+                logging.warning("Skipping broken line {0} of {1}".format(number, path))
+                continue
+            recorded.setdefault(request_key(entry["url"], entry.get("params")), []).append(entry)
+
+    responses = {}
+    for key, entries in recorded.items():
+        entries.sort(key=lambda entry: entry["time"])
+        responses[key] = ([entry["time"] for entry in entries], entries)
+    return responses
+
+
+class ReplayHTTPError(Exception):
+    def __init__(self, message, response):
+        Exception.__init__(self, message)
+        self.response = response
+
+
+class ReplayResponse(object):
+    """Stands in for a requests.Response."""
+
+    def __init__(self, status_code, headers=None, body=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = body.encode("utf-8")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ReplayHTTPError("{0} {1}".format(self.status_code, self.content.decode("utf-8")), self)
+
+
+class ReplayFetcher(DepartureFetcher):
+    """A DepartureFetcher that answers from a recording instead of the API.
+
+    Whether a request fails depends only on seed, the query and how many
+    requests of that query came before, so runs with the same recording and
+    settings fail the same requests, however the worker threads interleave.
+    The backoff jitter comes from a generator seeded with seed.
+    """
+
+    def __init__(self, path, speed=1.0, latency=0, error_rate=0, seed=0, **kwargs):
+        DepartureFetcher.__init__(self, **kwargs)
+        self.responses = load_recording(path)
+        if not self.responses:
+            raise ValueError("No responses recorded in {0}".format(path))
+        first = min(times[0] for times, _ in self.responses.values())
+        last = max(times[-1] for times, _ in self.responses.values())
+        self.first = first
+        self.span = last - first
+        self.speed = speed
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.requests = {}  # request key -> requests made so far
+        self.lock = threading.Lock()
+        self.start = time.time()
+        logging.info("Replaying {0} queries ({1:.0f} s) from {2} at {3}x speed".format(
+            len(self.responses), self.span, path, speed))
+
+    def position(self):
+        """The recorded time that is being played back now."""
+        elapsed = (time.time() - self.start) * self.speed
+        if self.span > 0:
+            elapsed %= self.span
+        else:
+            elapsed = 0
+        return self.first + elapsed
+
+    def _lookup(self, url, params):
+        key = request_key(url, params)
+        recorded = self.responses.get(key)
+        if recorded is None:
+            # Other options for the same stop, e.g. a different results count
+            for (path, _), candidate in self.responses.items():
+                if path == key[0]:
+                    recorded = candidate
+                    break
+            else:
+                return None
+        times, entries = recorded
+        # Before the first response of a query, that one is used
+        index = max(bisect.bisect_right(times, self.position()) - 1, 0)
+        return entries[index]
+
+    def _fails(self, url, params):
+        # Runs on the worker threads
+        key = request_key(url, params)
+        with self.lock:
+            count = self.requests.get(key, 0)
+            self.requests[key] = count + 1
+        # A str seed is hashed the same way in every run, unlike hash()
+        return random.Random("{0}|{1}|{2}".format(self.seed, key, count)).random() < self.error_rate
+
+    def _get(self, url, params, headers):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._fails(url, params):
+            return ReplayResponse(503, body="Replayed error")
+
+        entry = self._lookup(url, params)
+        if entry is None:
+            return ReplayResponse(404, body="Not in the recording")
+        response_headers = entry.get("headers", {})
+        etag = response_headers.get("ETag")
+        if etag and headers.get("If-None-Match") == etag:
+            return ReplayResponse(304, response_headers)
+        return ReplayResponse(entry["status"], response_headers, entry["body"])
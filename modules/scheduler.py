@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from modules import metrics
+from modules.cache import DepartureCache
+from modules.fetcher import FetchError
+
+
+class FetchScheduler(object):
+    """Polls every distinct departure query from an asyncio event loop.
+
+    Boards subscribe with the URL and parameters they need, and boards asking
+    for the same query share one poll. The event loop runs on a single
+    background thread and owns all timing: one timer per query, at most one
+    request in flight per query and a deadline for every request. The HTTP
+    client blocks, so the requests themselves run on a bounded thread pool.
+
+    Results are put on a queue that the Tk thread drains from one after
+    timer; subscribers are only ever called on the Tk thread. With a cache,
+    failed polls fall back to the last good response.
+
+    Without a Tk root (root=None) the queue is drained on the event loop
+    thread instead. Subscribers are then called there, and subscribe and
+    unsubscribe have to be called there too, e.g. through call_soon.
+    """
+
+    def __init__(self, root, fetcher, cache=None, max_workers=4, tick_ms=200, deadline=20):
+        self.root = root
+        self.fetcher = fetcher
+        self.cache = cache
+        self.tick_ms = tick_ms
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.results = queue.Queue()
+        self.queries = {}
+        self.after_id = None
+        self.stopped = False
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        # Event loop state, only touched on the loop thread
+        self._timers = {}
+        self._in_flight = {}
+        self._refetch = {}
+        self._expired = set()
+
+    def _key(self, url, params):
+        return (url, tuple(sorted(params.items())))
+
+    def subscribe(self, url, params, update_interval, callback, fields=None):
+        """Call callback(data, stale) on the Tk thread whenever the query
+        returns. stale is True when data comes from the cache instead of a
+        fresh response. If neither is available, data is a dict with a single
+        "error" key.
+
+        The callback may return a number of seconds to poll again sooner than
+        update_interval, or None. fields are the departure fields the callback
+        reads (see departures.response_fields), or None for all of them."""
+        key = self._key(url, params)
+        query = self.queries.get(key)
+        if query is None:
+            query = {
+                "key": key,
+                "cache_key": DepartureCache.make_key(url, params),
+                "url": url,
+                "params": params,
+                "subscribers": [],
+            }
+            self.queries[key] = query
+        else:
+            logging.info("Sharing departures query {0} between boards".format(url))
+        query["subscribers"].append((callback, update_interval, fields))
+        # Give the new subscriber data as soon as possible
+        self.call_soon(self._schedule, key, self._request(query), 0)
+
+    def _request(self, query):
+        """Snapshot of what the event loop needs to poll a query."""
+        fields = frozenset()
+        for subscriber in query["subscribers"]:
+            if subscriber[2] is None:
+                fields = None
+                break
+            fields |= subscriber[2]
+        return (query["url"], query["params"], fields)
+
+    def unsubscribe(self, url, params, callback):
+        key = self._key(url, params)
+        query = self.queries.get(key)
+        if query is None:
+            return
+        query["subscribers"] = [s for s in query["subscribers"] if s[0] is not callback]
+        if not query["subscribers"]:
+            del self.queries[key]
+            self.call_soon(self._cancel, key)
+            self.fetcher.forget(url, params)
+            metrics.CACHE_AGE.remove(url=url)
+
+    def start(self):
+        # Show cached departures right away instead of waiting for the network
+        if self.cache is not None:
+            for query in self.queries.values():
+                cached = self.cache.get(query["cache_key"])
+                if cached is not None:
+                    logging.info("Showing cached departures for {0} until the first fetch".format(
+                        query["url"]))
+                    self._notify(query, cached[0], True)
+        self.thread = threading.Thread(target=self._run_loop, name="FetchScheduler", daemon=True)
+        self.thread.start()
+        if self.root is None:
+            self.call_soon(self._drain)
+        else:
+            self._drain()
+
+    def stop(self):
+        self.stopped = True
+        if self.after_id is not None and self.root is not None:
+            try:
+                self.root.after_cancel(self.after_id)
+            except Exception:
+                pass
+            self.after_id = None
+        self.call_soon(self._shutdown)
+
+    def call_soon(self, callback, *args):
+        """Run callback on the event loop thread."""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    # Event loop thread
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _shutdown(self):
+        for handle in self._timers.values():
+            handle.cancel()
+        for future in self._in_flight.values():
+            future.cancel()
+        self._timers.clear()
+        self.executor.shutdown(wait=False)
+        self.loop.stop()
+
+    def _schedule(self, key, request, delay):
+        handle = self._timers.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        self._timers[key] = self.loop.call_later(delay, self._start_fetch, key, request)
+
+    def _cancel(self, key):
+        handle = self._timers.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+        future = self._in_flight.get(key)
+        if future is not None:
+            # The worker thread cannot be interrupted, but its result is dropped
+            future.cancel()
+        self._refetch.pop(key, None)
+
+    def _start_fetch(self, key, request):
+        self._timers.pop(key, None)
+        if key in self._in_flight:
+            # A request that outlived its deadline is still running; poll again
+            # once it is done instead of piling up a second one
+            self._refetch[key] = request
+            return
+
+        url, params = request[:2]
+        logging.debug("Fetching departures from base URL {0} with params {1}".format(url, params))
+        future = self.loop.run_in_executor(self.executor, self._fetch, request)
+        self._in_flight[key] = future
+        deadline = self.loop.call_later(self.deadline, self._on_deadline, key, url, params, future)
+        future.add_done_callback(lambda f: self._on_done(key, url, f, deadline))
+
+    def _on_deadline(self, key, url, params, future):
+        if future.done():
+            return
+        logging.warning("Fetching {0} exceeded its {1} s deadline".format(url, self.deadline))
+        # A hanging API is backed off from like a failing one
+        self.fetcher.note_failure(url, params)
+        # Delivered now, so the board shows the failure (or cached data) on
+        # time; the late response is ignored
+        self._expired.add(future)
+        self.results.put((key, {"error": "Request exceeded the {0} s deadline".format(self.deadline)}))
+
+    def _on_done(self, key, url, future, deadline):
+        deadline.cancel()
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if future.cancelled():
+            self._expired.discard(future)
+            return
+        if future in self._expired:
+            self._expired.discard(future)
+            logging.info("Dropping late response for {0}".format(url))
+        else:
+            self.results.put((key, future.result()))
+        if key in self._refetch:
+            self._start_fetch(key, self._refetch.pop(key))
+
+    def _fetch(self, request):
+        # Runs on a worker thread
+        url, params, fields = request
+        try:
+            data = self.fetcher.fetch(url, params, fields)
+            if self.cache is not None:
+                self.cache.store(DepartureCache.make_key(url, params), data)
+        except FetchError as e:
+            data = {"error": str(e)}
+        except Exception as e:
+            logging.exception("Unexpected error fetching departures")
+            data = {"error": str(e)}
+        return data
+
+    # Tk thread
+
+    def _drain(self):
+        if self.stopped:
+            return
+        while True:
+            try:
+                key, data = self.results.get_nowait()
+            except queue.Empty:
+                break
+            query = self.queries.get(key)
+            if query is not None:
+                self._deliver(query, data)
+        if self.root is None:
+            self.after_id = self.loop.call_later(self.tick_ms / 1000.0, self._drain)
+        else:
+            self.after_id = self.root.after(self.tick_ms, self._drain)
+
+    def _deliver(self, query, data):
+        stale = False
+        if "error" in data and self.cache is not None:
+            cached = self.cache.get(query["cache_key"])
+            if cached is not None:
+                logging.warning("Fetching {0} failed ({1}), showing departures cached at {2}".format(
+                    query["url"], data["error"],
+                    datetime.fromtimestamp(cached[1]).strftime("%d.%m.%Y %H:%M:%S")))
+                data = cached[0]
+                stale = True
+                metrics.CACHE_AGE.set(time.time() - cached[1], url=query["url"])
+        if not stale and "error" not in data:
+            metrics.CACHE_AGE.set(0, url=query["url"])
+
+        hints = self._notify(query, data, stale)
+
+        # The most demanding board sets the pace for everyone on this query
+        interval = min([s[1] for s in query["subscribers"]] or [60])
+        if hints:
+            interval = max(1, min([interval] + hints))
+        delay = self.fetcher.next_delay(query["url"], query["params"], interval)
+        self.call_soon(self._schedule, query["key"], self._request(query), delay)
+        logging.debug("Next update of {0} scheduled at {1}".format(
+            query["url"], (datetime.now() + timedelta(seconds=delay)).strftime("%d.%m.%Y %H:%M:%S")))
+
+    def _notify(self, query, data, stale):
+        """Hand data to every subscriber and collect their poll interval hints."""
+        hints = []
+        for callback, _, _ in query["subscribers"]:
+            try:
+                hint = callback(data, stale)
+            except Exception:
+                logging.exception("Error updating board")
+                continue
+            if hint is not None:
+                hints.append(hint)
+        return hints
@@ -0,0 +1,139 @@
+"""Soak test: replays thousands of refresh cycles and checks that nothing grows.
+
+Run with ``novium.py --soak [options] [fixture.json ...]``. Every cycle
+pushes a departures response through the same parse, select, style and
+render steps as the benchmark, ticks the countdowns and lets Tk run its
+timers; every so often the board shows the error screen instead. After a
+warm-up the Tk widget count, the pending after timers and the number of
+allocated Python memory blocks are recorded, and the run fails if any of
+them is larger at the end (the blocks within a tolerance, as caches and
+interned strings may still settle). Without a display only the Python heap
+is checked.
+"""
+import argparse
+import gc
+import json
+import logging
+import sys
+import time
+
+from modules.bench import STAGES, create_board, load_fixtures, make_fixture, replay
+from modules.departures import compile_mapping, response_fields
+from modules.linestyles import LineStyleMatcher
+from modules.metrics import count_widgets
+from modules.utils.luacfgparser import parse_lua_cfg
+
+
+def pending_after_ids(root):
+    return len(root.tk.splitlist(root.tk.call("after", "info")))
+
+
+def measure(root):
+    """Return (widgets, after ids, allocated heap blocks) after a full collection."""
+    gc.collect()
+    # Unlike tracemalloc, this costs nothing while the cycles run
+    heap = sys.getallocatedblocks()
+    if root is None:
+        return None, None, heap
+    root.update_idletasks()
+    return count_widgets(root), pending_after_ids(root), heap
+
+
+def run(fixtures, config, renderer="widgets", cycles=5000, warmup=500, max_rows=15,
+        error_every=50, out=sys.stdout):
+    """Run the soak test. Returns (failures, heap before, heap after), where
+    failures lists what the Tk side leaked."""
+    fields = response_fields(config.get("CustomResponseMapping", {}))
+    accessors = compile_mapping(config.get("CustomResponseMapping", {}))
+    line_styles = LineStyleMatcher(config.get("LineStyles", {}))
+    root, board = create_board(renderer, config)
+
+    fixtures = [fixture if isinstance(fixture, str) else json.dumps(fixture) for fixture in fixtures]
+    from_file = [not fixture.lstrip().startswith("{") for fixture in fixtures]
+    # Measure after the same fixture every time, so the board is in the same state
+    period = len(fixtures)
+    requested = (warmup, cycles)
+    warmup = max(period, warmup // period * period)
+    cycles = max(warmup + period, cycles // period * period)
+    if (warmup, cycles) != requested:
+        out.write("Running {0} cycles with a warm-up of {1}, whole passes over the {2} fixture(s)\n".format(
+            cycles, warmup, period))
+    report_every = max(period, cycles // 10 // period * period)
+
+    baseline = None
+    start = time.perf_counter()
+    try:
+        for cycle in range(cycles):
+            index = cycle % period
+            measuring = index == period - 1
+            timings = dict((stage, []) for stage in STAGES)
+            if board is not None and error_every and cycle % error_every == error_every - 1 and not measuring:
+                board.show_message("Soak test error screen", font=("", 24))
+            else:
+                replay(fixtures[index], from_file[index], fields, accessors, line_styles, max_rows,
+                       root, board, timings)
+            if board is not None:
+                board.tick()
+                root.update()
+
+            if not measuring:
+                continue
+            if cycle + 1 == warmup:
+                baseline = measure(root)
+                out.write("Baseline after {0} cycles: {1}\n".format(cycle + 1, format_sample(baseline)))
+            elif baseline is not None and (cycle + 1) % report_every == 0:
+                out.write("Cycle {0}: {1}\n".format(cycle + 1, format_sample(measure(root))))
+        final = measure(root)
+    finally:
+        if root is not None:
+            root.destroy()
+
+    out.write("Final after {0} cycles ({1:.1f} s): {2}\n".format(
+        cycles, time.perf_counter() - start, format_sample(final)))
+
+    failures = []
+    names = ("Tk widget count", "pending after ids")
+    for name, before, after in zip(names, baseline[:2], final[:2]):
+        if before is not None and after > before:
+            failures.append("{0} grew from {1} to {2}".format(name, before, after))
+    return failures, baseline[2], final[2]
+
+
+def format_sample(sample):
+    widgets, after_ids, heap = sample
+    text = "{0} heap blocks".format(heap)
+    if widgets is not None:
+        text = "{0} widgets, {1} after ids, {2}".format(widgets, after_ids, text)
+    return text
+
+
+def main(argv, config_file="novium.cfg"):
+    parser = argparse.ArgumentParser(prog="novium.py --soak", description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", nargs="*", help="recorded departures responses (JSON or .jsonl recordings)")
+    parser.add_argument("--renderer", choices=("widgets", "canvas", "none"), default="widgets")
+    parser.add_argument("--cycles", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500, help="cycles before the baseline is taken")
+    parser.add_argument("--rows", type=int, default=15, help="rows rendered per board")
+    parser.add_argument("--heap-tolerance", type=int, default=1000,
+                        help="allocated Python memory blocks the heap may grow by after the warm-up")
+    parser.add_argument("--config", default=config_file)
+    args = parser.parse_args(argv)
+    if args.cycles <= args.warmup:
+        parser.error("--cycles must be larger than --warmup")
+
+    logging.basicConfig(level=logging.WARNING)
+    config = parse_lua_cfg(args.config)
+    # Different trips, lines and destinations, so rows and marquees get reused
+    fixtures = load_fixtures(args.fixtures) or [make_fixture(120, seed=seed) for seed in range(10)]
+
+    failures, heap_before, heap_after = run(fixtures, config, renderer=args.renderer, cycles=args.cycles,
+                                            warmup=args.warmup, max_rows=args.rows)
+    if heap_after - heap_before > args.heap_tolerance:
+        failures.append("Python heap grew by {0} blocks".format(heap_after - heap_before))
+
+    for failure in failures:
+        print("FAIL: {0}".format(failure))
+    if failures:
+        return 1
+    print("OK: nothing grew")
+    return 0
@@ -0,0 +1,63 @@
+import importlib
+import logging
+import threading
+import time
+
+
+class StartupTrace(object):
+    """Records how long each startup phase took.
+
+    Phases are always recorded (it is one clock read each), but only logged
+    once the trace is enabled, so phases that run before the config is read
+    are still reported.
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+        self.enabled = False
+
+    def enable(self):
+        self.enabled = True
+        for phase in self.phases:
+            self._log(*phase)
+
+    def mark(self, name):
+        now = time.perf_counter()
+        phase = (name, now - self.last, now - self.start)
+        self.last = now
+        self.phases.append(phase)
+        if self.enabled:
+            self._log(*phase)
+
+    def _log(self, name, took, total):
+        logging.info("Startup: {0} took {1:.0f} ms ({2:.0f} ms since start)".format(
+            name, took * 1000, total * 1000))
+
+
+def import_in_background(root, names, callback, poll_ms=50):
+    """Import the named modules on a worker thread, then call
+    callback(modules, error) on the Tk thread. modules maps each name to its
+    module; error is the exception that stopped the imports, or None."""
+    done = threading.Event()
+    modules = {}
+    error = []
+
+    def worker():
+        try:
+            for name in names:
+                modules[name] = importlib.import_module(name)
+        except Exception as e:
+            logging.exception("Failed to import {0}".format(names))
+            error.append(e)
+        done.set()
+
+    def poll():
+        if done.is_set():
+            callback(modules, error[0] if error else None)
+        else:
+            root.after(poll_ms, poll)
+
+    threading.Thread(target=worker, name="BackgroundImport", daemon=True).start()
+    root.after(poll_ms, poll)
@@ -1,75 +1,286 @@
+import marshal
+import os
 import re
-import ast
 
-def parse_lua_cfg(path):
+# Bump when the parser output changes, so stale compiled caches are ignored
+CACHE_VERSION = 2
+
+_token_re = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<comment>--\[(?P<level>=*)\[.*?\](?P=level)\]|--[^\n]*|\#[^\n]*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<number>-?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?))
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>[{}\[\]=,;])
+''', re.VERBOSE | re.DOTALL)
+
+_escape_re = re.compile(r'\\(\d{1,3}|x[0-9a-fA-F]{2}|.)', re.DOTALL)
+
+_escapes = {
+    'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v',
+    '\\': '\\', '"': '"', "'": "'", '\n': '\n',
+}
+
+_identifier_re = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_lua_keywords = frozenset((
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for', 'function', 'goto', 'if',
+    'in', 'local', 'nil', 'not', 'or', 'repeat', 'return', 'then', 'true', 'until', 'while',
+))
+
+# path -> (mtime, size, marshalled config) of configs parsed by this process
+_memory_cache = {}
+
+
+def _unescape(match):
+    esc = match.group(1)
+    if esc[0].isdigit():
+        return chr(int(esc))
+    if esc[0] == 'x':
+        return chr(int(esc[1:], 16))
+    if esc in _escapes:
+        return _escapes[esc]
+    raise ValueError("invalid escape sequence '\\%s'" % esc)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    length = len(text)
+    while pos < length:
+        match = _token_re.match(text, pos)
+        if match is None:
+            raise ValueError("Unexpected character %r at %s" % (text[pos], _location(text, pos)))
+        kind = match.lastgroup
+        if kind == 'level':
+            kind = 'comment'
+        if kind not in ('ws', 'comment'):
+            tokens.append((kind, match.group(kind), pos))
+        pos = match.end()
+    tokens.append(('eof', None, length))
+    return tokens
+
+
+def _location(text, pos):
+    line = text.count('\n', 0, pos) + 1
+    column = pos - (text.rfind('\n', 0, pos) + 1) + 1
+    return "line %d, column %d" % (line, column)
+
+
+class _Parser(object):
+    """Recursive descent parser over the token list of a Lua table constructor."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.index = 0
+
+    def error(self, message, token=None):
+        token = token or self.tokens[self.index]
+        return ValueError("%s at %s" % (message, _location(self.text, token[2])))
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def expect(self, value):
+        token = self.next()
+        if token[0] != 'op' or token[1] != value:
+            raise self.error("Expected '%s'" % value, token)
+
+    def parse(self):
+        token = self.peek()
+        if token[0] == 'name' and token[1] == 'return':
+            self.next()
+        value = self.value()
+        if self.peek()[0] != 'eof':
+            raise self.error("Unexpected trailing content")
+        return value
+
+    def value(self):
+        kind, text, pos = token = self.next()
+        if kind == 'string':
+            try:
+                return _escape_re.sub(_unescape, text[1:-1])
+            except ValueError as e:
+                raise self.error(str(e), token)
+        if kind == 'number':
+            if 'x' in text or 'X' in text:
+                return int(text, 16)
+            if '.' in text or 'e' in text or 'E' in text:
+                return float(text)
+            return int(text)
+        if kind == 'name':
+            if text == 'true':
+                return True
+            if text == 'false':
+                return False
+            if text == 'nil':
+                return None
+            raise self.error("Unexpected name '%s'" % text, token)
+        if kind == 'op' and text == '{':
+            return self.table()
+        raise self.error("Unexpected %s" % (repr(text) if text else "end of file"), token)
+
+    def table(self):
+        fields = {}
+        items = []
+        while True:
+            token = self.peek()
+            if token[0] == 'op' and token[1] == '}':
+                self.next()
+                break
+
+            following = self.peek(1)
+            if token[0] == 'op' and token[1] == '[':
+                self.next()
+                key = self.value()
+                self.expect(']')
+                self.expect('=')
+                fields[key] = self.value()
+            elif token[0] in ('name', 'string') and following[0] == 'op' and following[1] == '=':
+                key = self.value() if token[0] == 'string' else self.next()[1]
+                self.expect('=')
+                fields[key] = self.value()
+            else:
+                items.append(self.value())
+
+            token = self.next()
+            if token[0] == 'op' and token[1] in (',', ';'):
+                continue
+            if token[0] == 'op' and token[1] == '}':
+                break
+            raise self.error("Expected ',' or '}'", token)
+
+        if items and not fields:
+            return items
+        # Mixed tables keep their positional values under 1-based keys like Lua
+        for index, item in enumerate(items):
+            fields[index + 1] = item
+        return fields
+
+
+def parse_lua_text(text):
+    try:
+        return _Parser(text).parse()
+    except ValueError as e:
+        raise ValueError("Failed to parse pseudo-Lua config: %s" % e)
+
+
+def _default_cache_path(path):
+    return path + '.cache'
+
+
+def parse_lua_cfg(path, cache_path=None):
+    """Parse a config file, reusing the compiled result while the file's
+    modification time and size are unchanged."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _memory_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return marshal.loads(cached[1])
+
+    if cache_path is None:
+        cache_path = _default_cache_path(path)
+    try:
+        with open(cache_path, 'rb') as f:
+            version, cached_signature, compiled = marshal.loads(f.read())
+        if version == CACHE_VERSION and tuple(cached_signature) == signature:
+            _memory_cache[path] = (signature, compiled)
+            return marshal.loads(compiled)
+    except Exception:
+        # Missing, unreadable or outdated cache: just parse the file
+        pass
+
     with open(path, 'r', encoding='cp1252') as f:
-        lua = f.read()
-
-    # Replace Lua booleans
-    lua = lua.replace('true', 'True').replace('false', 'False')
-
-    # Remove inline comments
-    def strip_inline_comments(text):
-        result = []
-        for line in text.splitlines():
-            newline = ''
-            in_str = False
-            str_char = ''
-            i = 0
-            while i < len(line):
-                c = line[i]
-                if c in ('"', "'"):
-                    if not in_str:
-                        in_str = True
-                        str_char = c
-                    elif str_char == c:
-                        in_str = False
-                    newline += c
-                elif not in_str and line[i:i+2] == '--':
-                    break
-                elif not in_str and c == '#':
-                    break
-                else:
-                    newline += c
-                i += 1
-            if newline.strip():
-                result.append(newline)
-        return '\n'.join(result)
-
-    lua = strip_inline_comments(lua)
-
-    # Replace keys to JSON-style
-    lua = re.sub(r"'([^']+)'\s*=", r'"\1":', lua)
-    lua = re.sub(r'\["([^"]+)"\]\s*=', r'"\1":', lua)
-    lua = re.sub(r'(?<=[{,])\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=', r'"\1":', lua)
-    lua = re.sub(r',\s*([\]}])', r'\1', lua)
+        config = parse_lua_text(f.read())
 
+    compiled = marshal.dumps(config)
+    _memory_cache[path] = (signature, compiled)
     try:
-        return ast.literal_eval(lua)
-    except Exception as e:
-        raise ValueError("Failed to parse pseudo-Lua config: %s\nParsed text:\n%s" % (e, lua))
+        _atomic_write(cache_path, marshal.dumps((CACHE_VERSION, signature, compiled)), 'wb')
+    except Exception:
+        pass
+    return config
+
 
 def load(path):
     return parse_lua_cfg(path)
 
+
+def _format_key(k):
+    if isinstance(k, str) and _identifier_re.match(k) and k not in _lua_keywords:
+        return k
+    return '[%s]' % _format_value(k)
+
+
+def _format_string(v):
+    out = []
+    for c in v:
+        if c == '\\':
+            out.append('\\\\')
+        elif c == '"':
+            out.append('\\"')
+        elif c == '\n':
+            out.append('\\n')
+        elif c == '\r':
+            out.append('\\r')
+        elif c == '\t':
+            out.append('\\t')
+        elif ord(c) < 32:
+            out.append('\\%d' % ord(c))
+        else:
+            out.append(c)
+    return '"%s"' % ''.join(out)
+
+
 def _format_value(v, indent=0):
     pad = '    ' * indent
-    if isinstance(v, bool):
+    if v is None:
+        return 'nil'
+    elif isinstance(v, bool):
         return 'true' if v else 'false'
     elif isinstance(v, dict):
+        if not v:
+            return '{}'
         lines = []
         lines.append('{')
         for k, val in v.items():
-            lines.append(pad + '    %s = %s,' % (k, _format_value(val, indent+1)))
+            lines.append(pad + '    %s = %s,' % (_format_key(k), _format_value(val, indent+1)))
+        lines.append(pad + '}')
+        return '\n'.join(lines)
+    elif isinstance(v, (list, tuple)):
+        if not v:
+            return '{}'
+        lines = []
+        lines.append('{')
+        for val in v:
+            lines.append(pad + '    %s,' % _format_value(val, indent+1))
         lines.append(pad + '}')
         return '\n'.join(lines)
     elif isinstance(v, str):
-        # Escape backslashes and double quotes for Lua string
-        escaped = v.replace('\\', '\\\\').replace('"', '\\"')
-        return '"%s"' % escaped
+        return _format_string(v)
+    elif isinstance(v, float):
+        return repr(v)
     else:
         return str(v)
 
+
+def _atomic_write(path, data, mode, encoding=None):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
 def save(config, path):
-    with open(path, 'w', encoding='cp1252') as f:
-        f.write(_format_value(config))
+    text = _format_value(config)
+    # Only write what reads back as the same config
+    if parse_lua_text(text) != config:
+        raise ValueError("Config does not round-trip through the Lua config format")
+    _atomic_write(path, text, 'w', encoding='cp1252')
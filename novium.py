@@ -1,635 +1,1031 @@
-import tkinter as tk
-import requests
-import json
-import os
-import sys
-from datetime import datetime, timedelta
-import ctypes
-import logging
-import threading
-from PIL import Image, ImageTk
-from modules.utils.luacfgparser import parse_lua_cfg as cfgparse
-
-APP_VERSION = "2.0"
-CONFIG_FILE = "novium.cfg"
-LOGS_FOLDER_NAME = "logs"
-IMAGE_FOLDER = "images"
-
-passenger_frontend_error_fallback_text = (
-    "Aufgrund einer technischen Störung ist diese Fahrtzielanzeige\n"
-    "vorübergehend außer Betrieb. Bitte beachten sie den\n"
-    "Fahrplanaushang oder die Anzeigen am Gleis."
-    "\n\n"
-    "Wir entschuldigen uns für die Unannehmlichkeiten\n"
-    "und wünschen ihnen eine schöne Reise."
-)
-
-no_departures_fallback_text = (
-    "Derzeit keine Abfahrten von dieser Haltestelle.\n"
-    "Bitte Fahrplanaushang beachten."
-)
-
-running = True
-is_closing = False
-
-clock_after_id = None
-fetch_after_id = None
-
-def get_build_timestamp():
-    try:
-        if getattr(sys, 'frozen', False):
-            # Frozen executable (e.g., cx_Freeze or py2exe)
-            path = sys.executable
-        else:
-            # Running as a script
-            path = os.path.abspath(__file__)
-
-        timestamp = os.path.getmtime(path)
-        dt = datetime.fromtimestamp(timestamp)
-        return dt.strftime("%A, %B %d, %Y %H:%M:%S")
-    except Exception:
-        return "Unknown"
-
-def setup_logging():
-    try:
-        log_dir = os.path.join(os.getcwd(), LOGS_FOLDER_NAME)
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        log_file = os.path.join(log_dir, timestamp + ".log")
-
-        logging.basicConfig(
-            filename=log_file,
-            level=logging.DEBUG,
-            format='[%(asctime)s] %(levelname)s: %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-
-        logging.info("Starting Novium Version {0}, compiled {1}".format(APP_VERSION, get_build_timestamp()))
-    except Exception:
-        pass
-
-def load_font(ttf_path):
-    """Load a .ttf font from a file without installing it system-wide."""
-    if os.path.exists(ttf_path):
-        FR_PRIVATE = 0x10
-        try:
-            ctypes.windll.gdi32.AddFontResourceExW(ttf_path, FR_PRIVATE, 0)
-            logging.info("Loaded font: {0}".format(ttf_path))
-        except Exception as e:
-            logging.error("Failed to load font: {0}, Error: {1}".format(ttf_path, e))
-    else:
-        logging.error("Font not found: {0}".format(ttf_path))
-
-def safe_after_cancel(root, after_id):
-    try:
-        if after_id is not None:
-            root.after_cancel(after_id)
-    except Exception:
-        pass
-
-
-def update_clock(hour_label, colon_label, minute_label, toggle_colon_visibility, header_bg_color):
-    global clock_after_id, running, is_closing
-    if not running or is_closing:
-        return
-    try:
-        current_time = datetime.now()
-        hour = current_time.strftime("%H")
-        minute = current_time.strftime("%M")
-
-        if hour_label.winfo_exists():
-            hour_label.config(text=hour)
-        if minute_label.winfo_exists():
-            minute_label.config(text=minute)
-
-        if toggle_colon_visibility[0]:
-            if colon_label.winfo_exists():
-                colon_label.config(fg="white")
-        else:
-            if colon_label.winfo_exists():
-                colon_label.config(fg=header_bg_color)
-
-        toggle_colon_visibility[0] = not toggle_colon_visibility[0]
-
-        clock_after_id = hour_label.after(1000, lambda: update_clock(hour_label, colon_label, minute_label, toggle_colon_visibility, header_bg_color))
-    except Exception:
-        logging.exception("Error updating clock")
-        
-def clear_content(content_frame):
-    try:
-        if content_frame.winfo_exists():
-            for widget in content_frame.winfo_children():
-                widget.destroy()
-    except Exception:
-        logging.exception("Error clearing content frame")
-
-
-def format_departure_time(departure_datetime_str):
-    try:
-        if not isinstance(departure_datetime_str, str):
-            return "N/A"
-        departure_time = datetime.strptime(departure_datetime_str[:19], "%Y-%m-%dT%H:%M:%S")
-        now = datetime.now()
-        time_difference = (departure_time - now).total_seconds()
-        if 0 < time_difference <= 44 * 60:
-            minutes = int(time_difference // 60)
-            return "{0} min".format(minutes)
-        elif time_difference <= 0:
-            return "Jetzt "
-        else:
-            return departure_time.strftime("%H:%M")
-    except Exception:
-        logging.exception("Failed to format departure time")
-        return "N/A"
-
-def start_marquee(label, text, delay=150):
-    """Make label text scroll horizontally if it's too wide."""
-    # Store the full text and current position in label object
-    label.full_text = text + "    "  # Add spaces for smooth scrolling
-    label.pos = 0
-
-    def scroll():
-        if not label.winfo_exists():
-            return  # widget destroyed
-
-        # Display a substring shifted by current position
-        display_text = label.full_text[label.pos:] + label.full_text[:label.pos]
-        label.config(text=display_text)
-        label.pos = (label.pos + 1) % len(label.full_text)
-        label.after(delay, scroll)
-
-    scroll()
-
-def get_line_style(line_name, styles_config):
-    # Default style
-    style = {"bg": "#122080", "fg": "white", "font_size": 27}
-
-    # Match exact 3-digit number
-    if line_name.isdigit() and len(line_name) == 3 and "3DIGIT" in styles_config:
-        cfg = styles_config["3DIGIT"]
-        style.update({
-            "bg": cfg.get("bg", style["bg"]),
-            "fg": cfg.get("fg", style["fg"]),
-            "font_size": cfg.get("font_size", style["font_size"])
-        })
-        logging.debug("Line '{0}' matched 3DIGIT style: {1}".format(line_name, style))
-        return style
-
-    # Match keys in descending length (so 'ICE' gets checked before 'IC')
-    for key in sorted(styles_config.keys(), key=lambda k: len(k), reverse=True):
-        if key == "3DIGIT":
-            continue
-        if key in line_name:
-            cfg = styles_config[key]
-            style.update({
-                "bg": cfg.get("bg", style["bg"]),
-                "fg": cfg.get("fg", style["fg"]),
-                "font_size": cfg.get("font_size", style["font_size"])
-            })
-            logging.debug("Line '{0}' matched style '{1}': {2}".format(line_name, key, style))
-            return style
-
-    # No match
-    logging.debug("Line '{0}' did not match any style. Using default: {1}".format(line_name, style))
-    return style
-
-def fetch_departures(content_frame, config, root):
-    global fetch_after_id, running, is_closing
-    if not running or is_closing:
-        return
-
-    def map_field(departure, mapping, field_name, default=None):
-        path = mapping.get(field_name) if mapping else None
-
-        if path:
-            parts = path.split(".")
-            current = departure
-            for part in parts:
-                if isinstance(current, dict):
-                    current = current.get(part)
-                else:
-                    current = None
-                    break
-            if current is not None:
-                return current
-
-        if field_name == "line":
-            return departure.get("line", {}).get("name", "N/A")
-        elif field_name == "destination":
-            return departure.get("destination", {}).get("name", "N/A")
-        elif field_name == "time":
-            return departure.get("when") or departure.get("plannedWhen")
-        elif field_name == "platform":
-            return departure.get("platform") or departure.get("plannedPlatform")
-        elif field_name == "cancelled":
-            return departure.get("cancelled", False)
-
-        return default
-
-    def fetch_in_thread():
-        try:
-            stop_id = config.get("stopId")
-            req_base_url = config.get("reqBaseUrl")
-            req_options = config.get("reqOptions", {})
-
-            if stop_id is None or req_base_url is None:
-                return
-
-            url = req_base_url.format(stopId=stop_id)
-            params = {k: str(v).lower() for k, v in req_options.items()}
-
-            logging.info("Fetching departures from base URL {0} with params {1}".format(url, params))
-            response = requests.get(url, params=params, timeout=10, verify="cacert.pem")
-            response.raise_for_status()
-            data = response.json()
-        except Exception as e:
-            data = {"error": str(e)}
-
-        def update_ui():
-            if not running or is_closing:
-                return
-            clear_content(content_frame)
-
-            if "error" in data:
-                logging.error("An error occurred trying to fetch data: {0}".format(data["error"]))
-                label = tk.Label(content_frame, text=passenger_frontend_error_fallback_text,
-                                 fg="white", bg="#122080",
-                                 font=("DB Neo Screen Sans Regular", 24),
-                                 wraplength=content_frame.winfo_width() - 40)
-                label.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
-            else:
-                departures_list = data.get("departures", [])
-                if not departures_list:
-                    logging.info("No departures returned from API")
-                    no_departures_label = tk.Label(
-                        content_frame,
-                        text=no_departures_fallback_text,
-                        fg="white",
-                        bg="#122080",
-                        font=("", 24),
-                        wraplength=content_frame.winfo_width() - 40
-                    )
-                    no_departures_label.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
-                else:
-                    def minutes_to_departure(dep):
-                        when = map_field(dep, mapping, "time")
-                        try:
-                            if not when:
-                                return 99999
-                            dt = datetime.strptime(when[:19], "%Y-%m-%dT%H:%M:%S")
-                            diff = (dt - datetime.now()).total_seconds() / 60.0
-                            return diff if diff > 0 else 0
-                        except Exception:
-                            return 99999
-
-                    mapping = config.get("CustomResponseMapping", {})
-                    departures_list.sort(key=minutes_to_departure)
-
-                    logging.info("{0} departures retrieved from API".format(len(departures_list)))
-
-                    if config.get("fullscreen", True):
-                        height_ref = root.winfo_screenheight()
-                    else:
-                        height_ref = root.winfo_height()
-
-                    header_height = 80
-                    row_height = 61
-                    available_height = height_ref - header_height
-                    max_rows = available_height // row_height - 1
-
-                    for i, departure in enumerate(departures_list[:max_rows]):
-                        if not running or is_closing or not content_frame.winfo_exists():
-                            break
-
-                        element_frame = tk.Frame(content_frame, bg="#122080", height=60)
-                        element_frame.pack_propagate(False)
-                        element_frame.pack(fill=tk.X, pady=1)
-
-                        line_name = map_field(departure, mapping, "line")
-                        destination_name = map_field(departure, mapping, "destination")
-                        raw_when = map_field(departure, mapping, "time")
-                        platform_name = map_field(departure, mapping, "platform")
-                        cancelled = map_field(departure, mapping, "cancelled")
-
-                        if cancelled:
-                            formatted_time = "Fahrt fällt aus"
-                            platform_display_text = ""
-                            time_fg_color = "red"
-                            time_font_weight = "bold"
-                        else:
-                            formatted_time = format_departure_time(raw_when)
-                            platform_display_text = str(platform_name) if platform_name else ""
-                            time_fg_color = "white"
-                            time_font_weight = "normal"
-
-                        main_fg_color = "white"
-                        main_bg_color = "#122080"
-                        line_font_decoration = "bold"
-                        destination_font_decoration = ""
-
-                        style = get_line_style(line_name, config.get("LineStyles", {}))
-                        line_label_bg = style.get("bg", main_bg_color)
-                        line_label_fg = style.get("fg", main_fg_color)
-                        line_font_size = style.get("font_size", 27)
-
-                        line_display_frame = tk.Frame(element_frame, bg=line_label_bg, width=100)
-                        line_display_frame.pack_propagate(False)
-                        line_display_frame.pack(side=tk.LEFT, fill=tk.Y)
-
-                        line_label = tk.Label(line_display_frame, text=line_name, fg=line_label_fg, bg=line_label_bg,
-                                             font=("DB Neo Screen Sans Bold", line_font_size, line_font_decoration))
-                        line_label.pack(padx=5, pady=0, fill=tk.BOTH, expand=True)
-
-                        line_display_frame.update_idletasks()
-                        if line_label.winfo_reqwidth() > line_display_frame.winfo_width():
-                            start_marquee(line_label, line_name)
-
-                        destination_label = tk.Label(element_frame, text=destination_name,
-                                                     fg=main_fg_color, bg=main_bg_color,
-                                                     font=("DB Neo Screen Sans Regular", 24, destination_font_decoration))
-                        destination_label.pack(side=tk.LEFT, padx=20, pady=(5, 0))
-
-                        element_frame.update_idletasks()
-                        if destination_label.winfo_reqwidth() > destination_label.winfo_width():
-                            start_marquee(destination_label, destination_name)
-                            spacer_frame = tk.Frame(element_frame, bg=main_bg_color)
-                            spacer_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-                        time_label = tk.Label(element_frame, text=formatted_time, fg=time_fg_color, bg=main_bg_color,
-                                              font=("DB Neo Screen Sans Regular", 24, time_font_weight))
-                        time_label.pack(side=tk.RIGHT, padx=20, pady=(5, 0))
-
-                        if platform_display_text:
-                            platform_label = tk.Label(element_frame, text=platform_display_text,
-                                                      fg=main_fg_color, bg=main_bg_color,
-                                                      font=("DB Neo Screen Sans Bold", 24))
-                            platform_label.pack(side=tk.RIGHT, padx=20, pady=(5, 0))
-
-            update_interval = config.get("updateInterval", 60)
-            next_update_time = datetime.now() + timedelta(seconds=update_interval)
-            fetch_after_id = root.after(update_interval * 1000,
-                                         lambda: fetch_departures(content_frame, config, root))
-            logging.info("Next update scheduled at {0}".format(
-                next_update_time.strftime("%d.%m.%Y %H:%M:%S")))
-
-        root.after(0, update_ui)
-
-    threading.Thread(target=fetch_in_thread, daemon=True).start()
-
-def main():
-    global running, is_closing, clock_after_id, fetch_after_id
-    global passenger_frontend_error_fallback_text, no_departures_fallback_text
-    global line_styles
-    global scale
-
-    def get_scale_factor(root, base_width=1024, base_height=768):
-        screen_width = root.winfo_screenwidth()
-        screen_height = root.winfo_screenheight()
-        scale_w = screen_width / base_width
-        scale_h = screen_height / base_height
-        return min(scale_w, scale_h)
-
-    setup_logging()
-    logging.info("Application initializing")
-
-    root = tk.Tk()
-    root.withdraw()
-
-    load_font("fonts/DBNeoScreenSans-Regular.ttf")
-    load_font("fonts/DBNeoScreenSans-Bold.ttf")
-
-    scale = get_scale_factor(root)
-
-    try:
-        with open(CONFIG_FILE, "r") as f:
-            config = cfgparse(CONFIG_FILE)
-    except Exception as e:
-        ctypes.windll.user32.MessageBoxW(0,
-            u"Fehler beim Laden der Konfigurationsdatei:\n{0}".format(e),
-            u"Fehler",
-            0x10)
-        sys.exit(1)
-    
-    line_styles = config.get("LineStyles", {})
-    logging.info("Retrieved Line Styles from configuration file")
-    
-    root.deiconify()
-
-    root.title("Novium")
-
-    if config.get("fullscreen", True):
-        root.attributes("-fullscreen", True)
-    else:
-        root.geometry("1024x768")
-
-    root.configure(bg="#122080")
-
-    if not config.get("showcursor", True):
-        root.bind("<FocusIn>", lambda e: e.widget.config(cursor="none"))
-        root.bind("<FocusOut>", lambda e: e.widget.config(cursor=""))
-        root.bind("<Enter>", lambda e: e.widget.config(cursor="none"))
-        root.bind("<Leave>", lambda e: e.widget.config(cursor=""))
-
-    try:
-        if os.path.exists("icon.ico"):
-            root.iconbitmap("icon.ico")
-    except Exception:
-        pass
-
-    header_bg_color = "#122080"
-    top_header_frame = tk.Frame(root, bg=header_bg_color)
-    top_header_frame.pack(side=tk.TOP, fill=tk.X)
-
-    logo_path = config.get("LogoImage")
-    db_logo_image = None
-
-    if logo_path:
-        abs_logo_path = os.path.abspath(logo_path)
-        logging.info("Configured logo path: {0}".format(abs_logo_path))
-
-        if os.path.exists(abs_logo_path):
-            try:
-                logging.info("---- BEGIN LOADING OF IMAGE {0} ----".format(abs_logo_path))
-                img = Image.open(abs_logo_path)
-
-                # Scaling
-                orig_width, orig_height = img.size
-                max_size = int(40 * scale * 1.6)
-                if orig_width > orig_height:
-                    new_width = max_size
-                    new_height = int(orig_height * (max_size / orig_width))
-                else:
-                    new_height = max_size
-                    new_width = int(orig_width * (max_size / orig_height))
-
-                img = img.resize((new_width, new_height), Image.LANCZOS)
-                db_logo_image = ImageTk.PhotoImage(img)
-                root.db_logo_image = db_logo_image
-                logging.info("---- END OF LOADING OF IMAGE {0} ----".format(abs_logo_path))
-            except Exception as e:
-                logging.error("Failed to load logo image: {0}".format(e))
-        else:
-            logging.warning("Logo path configured but file does not exist: {0}".format(abs_logo_path))
-    else:
-        logging.warning("No LogoImage configured in the config file.")
-        
-    # Configure grid layout with 3 columns for the header
-    top_header_frame.columnconfigure(0, weight=1)
-    top_header_frame.columnconfigure(1, weight=1)
-    top_header_frame.columnconfigure(2, weight=1)
-
-    # Left frame for stop sign and station label
-    left_frame = tk.Frame(top_header_frame, bg=header_bg_color)
-    left_frame.grid(row=0, column=0, sticky="w", padx=20, pady=10)
-
-    if db_logo_image:
-        tk.Label(left_frame, image=db_logo_image, bg=header_bg_color).pack(side=tk.LEFT, padx=(0, 5))
-
-    center_frame = tk.Frame(top_header_frame, bg=header_bg_color)
-    center_frame.grid(row=0, column=1)
-
-    # Determine header text based on config type
-    display_type = config.get("type", "departures").lower()
-    if display_type == "arrivals":
-        german_text = "Ankünfte"
-        english_text = "Arrivals"
-    elif display_type == "departures":
-        german_text = "Abfahrten"
-        english_text = "Departures"
-    else:
-        # fallback if config type invalid
-        german_text = "Abfahrten"
-        english_text = "Departures"
-
-    abfahrten_label = tk.Label(
-        center_frame,
-        text=german_text,
-        fg="white",
-        bg=header_bg_color,
-        font=("DB Neo Screen Sans Bold", 24),
-    )
-    abfahrten_label.pack(side=tk.LEFT)
-
-    departures_label = tk.Label(
-        center_frame,
-        text=english_text,
-        fg="white",
-        bg=header_bg_color,
-        font=("DB Neo Screen Sans Regular", 20, "italic"),
-    )
-    departures_label.pack(side=tk.LEFT, padx=(5,0))
-
-    # Right frame for clock
-    clock_frame = tk.Frame(top_header_frame, bg=header_bg_color)
-    clock_frame.grid(row=0, column=2, sticky="e", padx=20, pady=10)
-
-    hour_label = tk.Label(clock_frame, text="", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
-    hour_label.pack(side=tk.LEFT)
-
-    colon_label = tk.Label(clock_frame, text=":", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
-    colon_label.pack(side=tk.LEFT)
-
-    minute_label = tk.Label(clock_frame, text="", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
-    minute_label.pack(side=tk.LEFT)
-
-    toggle_colon_visibility = [True]
-    update_clock(hour_label, colon_label, minute_label, toggle_colon_visibility, header_bg_color)
-
-    # --- Header Labels Section ---
-    header_labels_frame = tk.Frame(root, bg="#122080")
-    header_labels_frame.pack(fill=tk.X)
-
-    header_labels_frame.columnconfigure(0, weight=0)  # Line
-    header_labels_frame.columnconfigure(1, weight=1)  # Destination (expands)
-    header_labels_frame.columnconfigure(2, weight=0)  # Platform
-    header_labels_frame.columnconfigure(3, weight=0)  # Arrival
-
-    def create_dual_language_label(parent, german, english, anchor="w", justify="left", padx=(5, 5)):
-        frame = tk.Frame(parent, bg="#122080")
-
-        german_label = tk.Label(
-            frame,
-            text=german,
-            font=("DB Neo Screen Sans Bold", int(20 * scale)),
-            fg="white",
-            bg="#122080",
-            anchor=anchor,
-            justify=justify
-        )   
-        german_label.pack(anchor=anchor)
-
-        english_label = tk.Label(
-            frame,
-            text=english,
-            font=("DB Neo Screen Sans Regular", int(16 * scale), "italic"),
-            fg="white",
-            bg="#122080",
-            anchor=anchor,
-            justify=justify
-        )
-        english_label.pack(anchor=anchor)
-        
-        return frame
-
-    line_header = create_dual_language_label(
-        header_labels_frame, "Linie", "Line",
-        anchor="center", justify="left", padx=(10, 5)
-    )
-    line_header.grid(row=0, column=0, sticky="w", padx=(10, 5))
-
-    destination_header = create_dual_language_label(
-        header_labels_frame, "Ziel", "Destination",
-        anchor="w", justify="center"
-    )
-    destination_header.config(width=50)  # Adjust width as needed
-    destination_header.grid(row=0, column=1, sticky="nw", padx=(5, 5))
-    destination_header.place(x=120)
-
-    platform_header = create_dual_language_label(
-        header_labels_frame, "Gleis", "Platform",
-        anchor="e", justify="right"
-    )
-    platform_header.config(width=10)  # Adjust width as needed
-    platform_header.grid(row=0, column=2, sticky="e", padx=(5, 15))
-
-    arrival_header = create_dual_language_label(
-        header_labels_frame, "Geplant", "Scheduled",
-        anchor="e", justify="right"
-    )
-    arrival_header.grid(row=0, column=3, sticky="e", padx=(5, 10))
-    # --- End Header Labels Section ---
-
-    separator = tk.Frame(root, bg="white", height=2)
-    separator.pack(fill=tk.X, pady=(2, 2))
-    
-    content_frame = tk.Frame(root, bg="#122080")
-    content_frame.pack(expand=True, fill=tk.BOTH)
-
-    fetch_departures(content_frame, config, root)
-
-    def on_closing():
-        global running, is_closing
-        is_closing = True
-        running = False
-
-        safe_after_cancel(root, clock_after_id)
-        safe_after_cancel(root, fetch_after_id)
-
-        logging.info("Application closing")
-
-        try:
-            root.quit()
-        except Exception:
-            pass
-
-        root.after(50, root.destroy)
-
-    root.protocol("WM_DELETE_WINDOW", on_closing)
-
-    root.mainloop()
-
-
-if __name__ == "__main__":
-    main()
+import time
+
+# Everything from here on counts towards the "imports" startup phase
+_start_time = time.perf_counter()
+
+import tkinter as tk
+import os
+import sys
+from datetime import datetime
+import logging
+import logging.handlers
+import queue
+from modules.utils.luacfgparser import parse_lua_cfg as cfgparse
+from modules.assets import AssetCache
+from modules.board import DepartureBoard
+from modules.cache import DepartureCache
+from modules.configwatch import ConfigWatcher
+from modules.canvasboard import CanvasDepartureBoard
+from modules.departures import compile_mapping, response_fields, response_key, select_departures, utc_now
+from modules.filters import DepartureFilter
+from modules.layout import estimate_max_rows
+from modules.linestyles import LineStyleMatcher
+from modules import metrics
+from modules.marquee import MarqueeDriver
+from modules.startup import StartupTrace, import_in_background
+
+APP_VERSION = "2.0"
+CONFIG_FILE = "novium.cfg"
+LOGS_FOLDER_NAME = "logs"
+CACHE_FILE = os.path.join("cache", "departures.json")
+IMAGE_FOLDER = "images"
+
+passenger_frontend_error_fallback_text = (
+    "Aufgrund einer technischen Störung ist diese Fahrtzielanzeige\n"
+    "vorübergehend außer Betrieb. Bitte beachten sie den\n"
+    "Fahrplanaushang oder die Anzeigen am Gleis."
+    "\n\n"
+    "Wir entschuldigen uns für die Unannehmlichkeiten\n"
+    "und wünschen ihnen eine schöne Reise."
+)
+
+no_departures_fallback_text = (
+    "Derzeit keine Abfahrten von dieser Haltestelle.\n"
+    "Bitte Fahrplanaushang beachten."
+)
+
+no_arrivals_fallback_text = (
+    "Derzeit keine Ankünfte an dieser Haltestelle.\n"
+    "Bitte Fahrplanaushang beachten."
+)
+
+# Shown on boards without cached departures until the first response
+loading_text = "Fahrplandaten werden geladen..."
+
+running = True
+is_closing = False
+
+clock_after_id = None
+countdown_after_id = None
+metrics_after_id = None
+
+def get_build_timestamp():
+    try:
+        if getattr(sys, 'frozen', False):
+            # Frozen executable (e.g., cx_Freeze or py2exe)
+            path = sys.executable
+        else:
+            # Running as a script
+            path = os.path.abspath(__file__)
+
+        timestamp = os.path.getmtime(path)
+        dt = datetime.fromtimestamp(timestamp)
+        return dt.strftime("%A, %B %d, %Y %H:%M:%S")
+    except Exception:
+        return "Unknown"
+
+def setup_logging(config):
+    """Log to a rotating file through a queue, so the Tk thread never waits
+    for the disk. Returns the QueueListener doing the writing, or None."""
+    try:
+        log_dir = os.path.join(os.getcwd(), config.get("LogsFolder", LOGS_FOLDER_NAME))
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        log_file = os.path.join(log_dir, "novium.log")
+        backup_count = config.get("logBackupCount", 5)
+        if config.get("logRotation", "size") == "daily":
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                log_file, when="midnight", backupCount=backup_count, encoding="utf-8")
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=config.get("logMaxSize", 1024) * 1024, backupCount=backup_count,
+                encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter(
+            fmt='[%(asctime)s] %(levelname)s: %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+        log_queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, file_handler)
+        listener.start()
+
+        root_logger = logging.getLogger()
+        root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        set_log_level(config)
+
+        logging.info("Starting Novium Version {0}, compiled {1}".format(APP_VERSION, get_build_timestamp()))
+        return listener
+    except Exception:
+        return None
+
+def set_log_level(config):
+    level = str(config.get("logLevel", "INFO")).upper()
+    if not isinstance(logging.getLevelName(level), int):
+        logging.warning("Unknown logLevel {0}, using INFO".format(level))
+        level = "INFO"
+    logging.getLogger().setLevel(level)
+
+def show_error_box(message):
+    """Show a Windows message box, e.g. when the config cannot be used."""
+    import ctypes
+    ctypes.windll.user32.MessageBoxW(0, message, u"Fehler", 0x10)
+
+def load_font(ttf_path):
+    """Load a .ttf font from a file without installing it system-wide."""
+    if os.path.exists(ttf_path):
+        FR_PRIVATE = 0x10
+        try:
+            import ctypes
+            ctypes.windll.gdi32.AddFontResourceExW(ttf_path, FR_PRIVATE, 0)
+            logging.info("Loaded font: {0}".format(ttf_path))
+        except Exception as e:
+            logging.error("Failed to load font: {0}, Error: {1}".format(ttf_path, e))
+    else:
+        logging.error("Font not found: {0}".format(ttf_path))
+
+def safe_after_cancel(root, after_id):
+    try:
+        if after_id is not None:
+            root.after_cancel(after_id)
+    except Exception:
+        pass
+
+
+def update_clock(root, clocks, toggle_colon_visibility, header_bg_color):
+    """Tick the header clock of every board window from a single timer."""
+    global clock_after_id, running, is_closing
+    if not running or is_closing:
+        return
+    try:
+        current_time = datetime.now()
+        hour = current_time.strftime("%H")
+        minute = current_time.strftime("%M")
+
+        for hour_label, colon_label, minute_label in clocks:
+            if hour_label.winfo_exists():
+                hour_label.config(text=hour)
+            if minute_label.winfo_exists():
+                minute_label.config(text=minute)
+
+            if toggle_colon_visibility[0]:
+                if colon_label.winfo_exists():
+                    colon_label.config(fg="white")
+            else:
+                if colon_label.winfo_exists():
+                    colon_label.config(fg=header_bg_color)
+
+        toggle_colon_visibility[0] = not toggle_colon_visibility[0]
+
+        clock_after_id = root.after(1000, lambda: update_clock(root, clocks, toggle_colon_visibility, header_bg_color))
+    except Exception:
+        logging.exception("Error updating clock")
+
+
+def update_countdowns(root, boards):
+    """Recompute the time column of every board once a second, independent of
+    how often the departures are fetched."""
+    global countdown_after_id, running, is_closing
+    if not running or is_closing:
+        return
+    try:
+        for board in boards:
+            board.tick()
+    except Exception:
+        logging.exception("Error updating countdowns")
+    countdown_after_id = root.after(1000, lambda: update_countdowns(root, boards))
+
+
+def update_metrics(root, marquee, interval_ms):
+    """Sample the metrics that have to be read on the Tk thread."""
+    global metrics_after_id, running, is_closing
+    if not running or is_closing:
+        return
+    try:
+        metrics.sample_tk(root, marquee)
+    except Exception:
+        logging.exception("Error sampling metrics")
+    metrics_after_id = root.after(interval_ms, lambda: update_metrics(root, marquee, interval_ms))
+
+
+def load_board_configs(config):
+    """Return one config per board.
+
+    Boards are listed in the optional Boards table, either by name
+    (Boards = { Hall = {...} }) or as a list (Boards = { {...}, {...} }), whose
+    boards are named by their position unless they set a name. Each board
+    inherits every top-level setting and may override any of them; nested
+    tables such as reqOptions are merged key by key. Without a Boards table
+    the top-level config describes a single board.
+
+    Raises ValueError if Boards is not such a table.
+    """
+    boards = config.get("Boards")
+    if not boards:
+        return [config]
+    if isinstance(boards, list):
+        named = [(str(index), board) for index, board in enumerate(boards, 1)]
+    elif isinstance(boards, dict):
+        named = [(str(name), boards[name]) for name in sorted(boards, key=str)]
+    else:
+        raise ValueError("Boards must be a table of boards")
+
+    board_configs = []
+    for name, board in named:
+        if not isinstance(board, dict):
+            raise ValueError("Board {0} must be a table".format(name))
+        board_config = dict((k, v) for k, v in config.items() if k != "Boards")
+        if isinstance(boards, list):
+            name = str(board.get("name", name))
+        for key, value in board.items():
+            if isinstance(value, dict) and isinstance(board_config.get(key), dict):
+                merged = dict(board_config[key])
+                merged.update(value)
+                board_config[key] = merged
+            else:
+                board_config[key] = value
+        board_config["name"] = name
+        board_configs.append(board_config)
+    return board_configs
+
+
+def board_kinds(config):
+    """What a board shows: ["departures"], ["arrivals"] or, for the
+    "combined" type, both one above the other."""
+    display_type = str(config.get("type", "departures")).lower()
+    if display_type == "combined":
+        return ["departures", "arrivals"]
+    if display_type == "arrivals":
+        return ["arrivals"]
+    return ["departures"]
+
+
+def section_configs(config):
+    """Return one config per section of a board, with type set to what the
+    section shows. Sections of a combined board are named after the board
+    and their kind, e.g. in logs and metrics."""
+    kinds = board_kinds(config)
+    if len(kinds) == 1:
+        return [dict(config, type=kinds[0])]
+    name = config.get("name", "default")
+    return [dict(config, type=kind, name="{0}/{1}".format(name, kind)) for kind in kinds]
+
+
+def get_max_rows(board, window, config):
+    """Number of departure rows that fit on a board.
+
+    Once the board has been laid out this is known; until then it is
+    estimated from the screen or the configured geometry.
+    """
+    max_rows = board.max_rows()
+    if max_rows is not None:
+        return max_rows
+
+    if config.get("fullscreen", True):
+        width_ref, height_ref = window.winfo_screenwidth(), window.winfo_screenheight()
+    else:
+        width_ref, height_ref = window.winfo_width(), window.winfo_height()
+        if height_ref <= 1:
+            # Not mapped yet, go by the configured geometry
+            try:
+                size = config.get("geometry", "1024x768").split("+")[0].split("x")
+                width_ref, height_ref = int(size[0]), int(size[1])
+            except (IndexError, ValueError):
+                width_ref, height_ref = 1024, 768
+    return estimate_max_rows(width_ref, height_ref)
+
+
+def get_departures_query(config, max_rows=None):
+    """Return the (url, params) pair a board polls, or None if not configured.
+
+    Arrivals boards poll reqArrivalsUrl or else reqBaseUrl with /departures
+    replaced by /arrivals.
+
+    With fitResultsToBoard and max_rows, only as many departures as the board
+    can show (plus a few spare) are requested, unless reqOptions sets results.
+    Filters the API understands are added as parameters, unless reqOptions
+    sets them itself.
+    """
+    stop_id = config.get("stopId")
+    req_base_url = config.get("reqBaseUrl")
+    req_options = config.get("reqOptions", {})
+
+    if stop_id is None or req_base_url is None:
+        return None
+
+    url = req_base_url.format(stopId=stop_id)
+    if config.get("type") == "arrivals":
+        if config.get("reqArrivalsUrl"):
+            url = config["reqArrivalsUrl"].format(stopId=stop_id)
+        elif "/departures" in url:
+            url = url.replace("/departures", "/arrivals", 1)
+        else:
+            return None
+    params = {k: str(v).lower() for k, v in req_options.items()}
+    departure_filter = DepartureFilter(config.get("Filters"))
+    for key, value in departure_filter.query_params().items():
+        params.setdefault(key, value)
+    # There is no telling how many departures the client-side filters drop
+    if config.get("fitResultsToBoard", False) and max_rows and "results" not in params \
+            and not departure_filter.drops_departures():
+        # Spare entries stand in for departures that are dropped as departed
+        params["results"] = str(max_rows + 5)
+    return url, params
+
+
+def render_departures(board, config, accessors, window, data, stale=False, departure_filter=None):
+    """Render fetched departures onto a board, leaving out those
+    departure_filter does not accept.
+
+    Returns the number of seconds after which this board would like the next
+    poll (sooner than updateInterval while a departure is imminent or a delay
+    has just changed), or None.
+    """
+    if not running or is_closing:
+        return None
+
+    board_name = config.get("name", "default")
+    metrics.ROWS_RENDERED.set(0, board=board_name)
+
+    if "error" in data:
+        logging.error("An error occurred trying to fetch data: {0}".format(data["error"]))
+        board.show_message(passenger_frontend_error_fallback_text,
+                           font=("DB Neo Screen Sans Regular", 24))
+        return None
+
+    kind = response_key(config.get("type"))
+    empty_text = no_arrivals_fallback_text if kind == "arrivals" else no_departures_fallback_text
+    raw_departures = data.get(kind, [])
+    if not raw_departures:
+        logging.info("No {0} returned from API".format(kind))
+        board.show_message(empty_text, font=("", 24))
+        return None
+
+    logging.debug("{0} {1} retrieved from API".format(len(raw_departures), kind))
+
+    # Cached data may be minutes old, so leave out trips that have gone
+    now = utc_now()
+    departures = select_departures(raw_departures, accessors, get_max_rows(board, window, config), now,
+                                   departed_grace=60 if stale else None, departure_filter=departure_filter)
+    if not departures:
+        board.show_message(empty_text, font=("", 24))
+        return None
+
+    delays_changed = board.show_departures(departures)
+    metrics.ROWS_RENDERED.set(len(departures), board=board_name)
+
+    if stale:
+        return None
+
+    imminent = config.get("imminentDeparture", 120)
+    for departure in departures:
+        if departure.cancelled or departure.when is None:
+            continue
+        if 0 <= departure.seconds_until(now) <= imminent:
+            logging.debug("Departure imminent, polling sooner")
+            return config.get("minUpdateInterval", 20)
+    if delays_changed:
+        logging.debug("Delays changed, polling sooner")
+        return config.get("minUpdateInterval", 20)
+    return None
+
+
+def load_logo(logo_path, scale, assets):
+    """Load the header logo, scaled through the asset cache. Returns a
+    PhotoImage or None."""
+    db_logo_image = None
+
+    if logo_path:
+        abs_logo_path = os.path.abspath(logo_path)
+        logging.info("Configured logo path: {0}".format(abs_logo_path))
+
+        if os.path.exists(abs_logo_path):
+            try:
+                logging.info("---- BEGIN LOADING OF IMAGE {0} ----".format(abs_logo_path))
+                max_size = int(40 * scale * 1.6)
+                db_logo_image = assets.scaled_image(abs_logo_path, max_size)
+                logging.info("---- END OF LOADING OF IMAGE {0} ----".format(abs_logo_path))
+            except Exception as e:
+                logging.error("Failed to load logo image: {0}".format(e))
+        else:
+            logging.warning("Logo path configured but file does not exist: {0}".format(abs_logo_path))
+    else:
+        logging.warning("No LogoImage configured in the config file.")
+
+    return db_logo_image
+
+
+def configure_window(window, config):
+    """Apply title, geometry, fullscreen and cursor settings to a board window."""
+    window.title("Novium")
+
+    geometry = config.get("geometry", "1024x768")
+    if config.get("fullscreen", True):
+        if "+" in geometry:
+            # Move to the right screen before going fullscreen there
+            window.geometry(geometry)
+        window.attributes("-fullscreen", True)
+    else:
+        window.attributes("-fullscreen", False)
+        window.geometry(geometry)
+
+    window.configure(bg="#122080")
+
+    if not config.get("showcursor", True):
+        window.bind("<FocusIn>", lambda e: e.widget.config(cursor="none"))
+        window.bind("<FocusOut>", lambda e: e.widget.config(cursor=""))
+        window.bind("<Enter>", lambda e: e.widget.config(cursor="none"))
+        window.bind("<Leave>", lambda e: e.widget.config(cursor=""))
+    else:
+        for sequence in ("<FocusIn>", "<FocusOut>", "<Enter>", "<Leave>"):
+            window.unbind(sequence)
+        window.config(cursor="")
+
+    try:
+        if os.path.exists("icon.ico"):
+            window.iconbitmap("icon.ico")
+    except Exception:
+        pass
+
+
+def build_header(window, config, scale, logo_image, before=None):
+    """Build the title bar and column headings of a board window.
+
+    Returns the header frames and the (hour, colon, minute) clock labels.
+    With before, the frames are packed above that widget.
+    """
+    pack_options = {"before": before} if before is not None else {}
+
+    header_bg_color = "#122080"
+    top_header_frame = tk.Frame(window, bg=header_bg_color)
+    top_header_frame.pack(side=tk.TOP, fill=tk.X, **pack_options)
+
+    # Configure grid layout with 3 columns for the header
+    top_header_frame.columnconfigure(0, weight=1)
+    top_header_frame.columnconfigure(1, weight=1)
+    top_header_frame.columnconfigure(2, weight=1)
+
+    # Left frame for stop sign and station label
+    left_frame = tk.Frame(top_header_frame, bg=header_bg_color)
+    left_frame.grid(row=0, column=0, sticky="w", padx=20, pady=10)
+
+    if logo_image:
+        tk.Label(left_frame, image=logo_image, bg=header_bg_color).pack(side=tk.LEFT, padx=(0, 5))
+
+    center_frame = tk.Frame(top_header_frame, bg=header_bg_color)
+    center_frame.grid(row=0, column=1)
+
+    # Determine header text based on config type
+    display_type = config.get("type", "departures").lower()
+    if display_type == "arrivals":
+        german_text = "Ankünfte"
+        english_text = "Arrivals"
+        german_column, english_column = "Von", "From"
+    elif display_type == "combined":
+        german_text = "Abfahrten & Ankünfte"
+        english_text = "Departures & Arrivals"
+        german_column, english_column = "Ziel / Von", "Destination / From"
+    else:
+        # departures, and the fallback if the config type is invalid
+        german_text = "Abfahrten"
+        english_text = "Departures"
+        german_column, english_column = "Ziel", "Destination"
+
+    abfahrten_label = tk.Label(
+        center_frame,
+        text=german_text,
+        fg="white",
+        bg=header_bg_color,
+        font=("DB Neo Screen Sans Bold", 24),
+    )
+    abfahrten_label.pack(side=tk.LEFT)
+
+    departures_label = tk.Label(
+        center_frame,
+        text=english_text,
+        fg="white",
+        bg=header_bg_color,
+        font=("DB Neo Screen Sans Regular", 20, "italic"),
+    )
+    departures_label.pack(side=tk.LEFT, padx=(5,0))
+
+    # Right frame for clock
+    clock_frame = tk.Frame(top_header_frame, bg=header_bg_color)
+    clock_frame.grid(row=0, column=2, sticky="e", padx=20, pady=10)
+
+    hour_label = tk.Label(clock_frame, text="", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
+    hour_label.pack(side=tk.LEFT)
+
+    colon_label = tk.Label(clock_frame, text=":", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
+    colon_label.pack(side=tk.LEFT)
+
+    minute_label = tk.Label(clock_frame, text="", fg="white", bg=header_bg_color, font=("DB Neo Screen Sans Bold", 24))
+    minute_label.pack(side=tk.LEFT)
+
+    # --- Header Labels Section ---
+    header_labels_frame = tk.Frame(window, bg="#122080")
+    header_labels_frame.pack(fill=tk.X, **pack_options)
+
+    header_labels_frame.columnconfigure(0, weight=0)  # Line
+    header_labels_frame.columnconfigure(1, weight=1)  # Destination (expands)
+    header_labels_frame.columnconfigure(2, weight=0)  # Platform
+    header_labels_frame.columnconfigure(3, weight=0)  # Arrival
+
+    def create_dual_language_label(parent, german, english, anchor="w", justify="left", padx=(5, 5)):
+        frame = tk.Frame(parent, bg="#122080")
+
+        german_label = tk.Label(
+            frame,
+            text=german,
+            font=("DB Neo Screen Sans Bold", int(20 * scale)),
+            fg="white",
+            bg="#122080",
+            anchor=anchor,
+            justify=justify
+        )
+        german_label.pack(anchor=anchor)
+
+        english_label = tk.Label(
+            frame,
+            text=english,
+            font=("DB Neo Screen Sans Regular", int(16 * scale), "italic"),
+            fg="white",
+            bg="#122080",
+            anchor=anchor,
+            justify=justify
+        )
+        english_label.pack(anchor=anchor)
+
+        return frame
+
+    line_header = create_dual_language_label(
+        header_labels_frame, "Linie", "Line",
+        anchor="center", justify="left", padx=(10, 5)
+    )
+    line_header.grid(row=0, column=0, sticky="w", padx=(10, 5))
+
+    destination_header = create_dual_language_label(
+        header_labels_frame, german_column, english_column,
+        anchor="w", justify="center"
+    )
+    destination_header.config(width=50)  # Adjust width as needed
+    destination_header.grid(row=0, column=1, sticky="nw", padx=(5, 5))
+    # Lines up with the destinations of the rows
+    destination_header.place(x=int(120 * scale))
+
+    platform_header = create_dual_language_label(
+        header_labels_frame, "Gleis", "Platform",
+        anchor="e", justify="right"
+    )
+    platform_header.config(width=10)  # Adjust width as needed
+    platform_header.grid(row=0, column=2, sticky="e", padx=(5, 15))
+
+    arrival_header = create_dual_language_label(
+        header_labels_frame, "Geplant", "Scheduled",
+        anchor="e", justify="right"
+    )
+    arrival_header.grid(row=0, column=3, sticky="e", padx=(5, 10))
+    # --- End Header Labels Section ---
+
+    separator = tk.Frame(window, bg="white", height=2)
+    separator.pack(fill=tk.X, pady=(2, 2), **pack_options)
+
+    return [top_header_frame, header_labels_frame, separator], (hour_label, colon_label, minute_label)
+
+
+def create_board(content_frame, config, marquee, shares_window=False):
+    line_styles = LineStyleMatcher(config.get("LineStyles", {}))
+    if config.get("renderer", "widgets") == "canvas":
+        return CanvasDepartureBoard(content_frame, marquee, line_styles, shares_window)
+    return DepartureBoard(content_frame, marquee, line_styles, shares_window)
+
+
+SECTION_TITLES = {
+    "departures": "Abfahrten  ·  Departures",
+    "arrivals": "Ankünfte  ·  Arrivals",
+}
+
+
+def build_board_window(window, config, scale, logo_image, marquee):
+    """Build the header and content area of one board window.
+
+    Returns the runtimes of the board's sections (see section_configs): dicts
+    holding a section's config, widgets and compiled settings, which config
+    reloads update in place. The sections share the window's header and the
+    full board config in runtime["chrome"].
+    """
+    configure_window(window, config)
+    header, clock = build_header(window, config, scale, logo_image)
+    # "body" lists what is packed below the header, so it can be rebuilt above
+    chrome = {"config": config, "header": header, "clock": clock, "body": []}
+
+    configs = section_configs(config)
+    runtimes = []
+    for section_config in configs:
+        kind = section_config["type"]
+        if len(configs) > 1:
+            title = tk.Label(window, text=SECTION_TITLES[kind], fg="white", bg="#122080", anchor="w",
+                             padx=20, font=("DB Neo Screen Sans Bold", int(20 * scale)))
+            title.pack(fill=tk.X)
+            chrome["body"].append(title)
+
+        content_frame = tk.Frame(window, bg="#122080")
+        content_frame.pack(expand=True, fill=tk.BOTH)
+        chrome["body"].append(content_frame)
+
+        runtimes.append({
+            "window": window,
+            "config": section_config,
+            "chrome": chrome,
+            "content_frame": content_frame,
+            "board": create_board(content_frame, section_config, marquee, shares_window=len(configs) > 1),
+            "accessors": compile_mapping(section_config.get("CustomResponseMapping", {}), kind),
+            "filters": DepartureFilter(section_config.get("Filters")),
+            "query": None,
+            "callback": None,
+            "last": None,
+        })
+    return runtimes
+
+
+def validate_config(config):
+    """Raise ValueError if config cannot be applied. Returns the board configs."""
+    if not isinstance(config, dict):
+        raise ValueError("The config must be a table")
+    board_configs = load_board_configs(config)
+    for board_config in board_configs:
+        for section_config in section_configs(board_config):
+            compile_mapping(section_config.get("CustomResponseMapping", {}), section_config["type"])
+            if section_config.get("stopId") is not None and section_config.get("reqBaseUrl") is not None \
+                    and get_departures_query(section_config) is None:
+                raise ValueError("reqArrivalsUrl must be set if reqBaseUrl has no /departures in it")
+        LineStyleMatcher(board_config.get("LineStyles", {}))
+        DepartureFilter(board_config.get("Filters"))
+        interval = board_config.get("updateInterval", 60)
+        if not isinstance(interval, (int, float)) or interval <= 0:
+            raise ValueError("updateInterval must be a positive number")
+    return board_configs
+
+
+def main():
+    global running, is_closing, clock_after_id
+    global passenger_frontend_error_fallback_text, no_departures_fallback_text
+    global scale
+
+    def get_scale_factor(root, base_width=1024, base_height=768):
+        screen_width = root.winfo_screenwidth()
+        screen_height = root.winfo_screenheight()
+        scale_w = screen_width / base_width
+        scale_h = screen_height / base_height
+        return min(scale_w, scale_h)
+
+    trace = StartupTrace(_start_time)
+    trace.mark("imports")
+
+    # The config is read first, since it sets up logging
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            config = cfgparse(CONFIG_FILE)
+    except Exception as e:
+        show_error_box(u"Fehler beim Laden der Konfigurationsdatei:\n{0}".format(e))
+        sys.exit(1)
+
+    trace.mark("config parse")
+
+    log_listener = setup_logging(config)
+    logging.info("Application initializing")
+    if config.get("startupTrace", False):
+        trace.enable()
+    trace.mark("logging")
+
+    root = tk.Tk()
+    root.withdraw()
+    trace.mark("Tk")
+
+    load_font("fonts/DBNeoScreenSans-Regular.ttf")
+    load_font("fonts/DBNeoScreenSans-Bold.ttf")
+    trace.mark("font load")
+
+    scale = get_scale_factor(root)
+
+    try:
+        board_configs = validate_config(config)
+    except ValueError as e:
+        show_error_box(u"Fehler in der Konfigurationsdatei:\n{0}".format(e))
+        sys.exit(1)
+    logging.info("Configured {0} board(s)".format(len(board_configs)))
+
+    # Logos are shared by every board that shows the same file
+    logos = {}
+    assets = AssetCache()
+
+    def get_logo(logo_path):
+        if logo_path not in logos:
+            logos[logo_path] = load_logo(logo_path, scale, assets)
+        return logos[logo_path]
+
+    root.deiconify()
+
+    cache = DepartureCache(CACHE_FILE, max_staleness=config.get("maxStaleness", 900))
+    # The HTTP client and the scheduler are imported in the background
+    # once the boards are up, see start_fetching
+    services = {"fetcher": None, "scheduler": None}
+
+    history = None
+    if config.get("historyFolder"):
+        from modules.history import HistoryWriter
+        history = HistoryWriter(config["historyFolder"], flush_interval=config.get("historyFlushInterval", 60))
+        try:
+            history.start()
+        except Exception as e:
+            logging.error("Failed to start the departure history: {0}".format(e))
+            history = None
+
+    marquee = MarqueeDriver(root)
+    runtimes = []  # one per board section
+    board_sections = []  # the runtimes of every board, in board order
+    clocks = []
+    boards = []
+    traced_first_fetch = []
+
+    def board_query(runtime):
+        return get_departures_query(runtime["config"],
+                                    get_max_rows(runtime["board"], runtime["window"], runtime["config"]))
+
+    def subscribe(runtime):
+        query = board_query(runtime)
+        runtime["query"] = query
+        if query is None:
+            logging.warning("Board {0} has no stopId or reqBaseUrl (or reqArrivalsUrl) configured".format(
+                runtime["config"].get("name", "default")))
+            return
+        url, params = query
+        if services["scheduler"] is None:
+            # Until fetching starts, show what the cache has
+            cached = cache.get(DepartureCache.make_key(url, params))
+            if cached is not None:
+                runtime["last"] = (cached[0], True)
+                show_last(runtime)
+            elif runtime["last"] is None:
+                runtime["board"].show_message(loading_text, font=("DB Neo Screen Sans Regular", 24))
+            return
+        services["scheduler"].subscribe(
+            url, params, runtime["config"].get("updateInterval", 60), runtime["callback"],
+            fields=response_fields(runtime["config"].get("CustomResponseMapping", {}), runtime["config"]["type"]))
+
+    def board_resized(runtime):
+        """Fill a board that now fits a different number of rows."""
+        if board_query(runtime) != runtime["query"]:
+            # fitResultsToBoard asks for a different number of results
+            if runtime["query"] is not None and services["scheduler"] is not None:
+                url, params = runtime["query"]
+                services["scheduler"].unsubscribe(url, params, runtime["callback"])
+            subscribe(runtime)
+        if runtime["last"] is not None:
+            show_last(runtime)
+
+    def render(runtime, data, stale):
+        start = time.perf_counter()
+        hint = render_departures(runtime["board"], runtime["config"], runtime["accessors"],
+                                 runtime["window"], data, stale, runtime["filters"])
+        metrics.RENDER_DURATION.observe(time.perf_counter() - start,
+                                        board=runtime["config"].get("name", "default"))
+        return hint
+
+    def show_last(runtime):
+        """Show the last data of a board again, e.g. after a resize. Only new
+        responses count as updates for the health check."""
+        render(runtime, *runtime["last"])
+
+    def start_section(runtime):
+        runtimes.append(runtime)
+        boards.append(runtime["board"])
+        # Counts as updated at startup, so a board that never gets data turns unhealthy
+        metrics.LAST_UPDATE.set(time.time(), board=runtime["config"].get("name", "default"))
+
+        def on_data(data, stale, runtime=runtime):
+            # Called by the scheduler with each response; stale data is the
+            # cached response shown because the fetch failed
+            board_name = runtime["config"].get("name", "default")
+            failed = stale or "error" in data
+            metrics.BOARD_ERROR.set(1 if failed else 0, board=board_name)
+            if not failed:
+                metrics.LAST_UPDATE.set(time.time(), board=board_name)
+            fresh = not failed and (runtime["last"] is None or runtime["last"][0] is not data)
+            runtime["last"] = (data, stale)
+            if history is not None and fresh:
+                # Normalised and written on the history thread
+                history.append(time.time(), board_name,
+                               data.get(response_key(runtime["config"].get("type")), []), runtime["accessors"])
+            first_live = not stale and not traced_first_fetch
+            if first_live:
+                traced_first_fetch.append(True)
+                trace.mark("first fetch")
+            hint = render(runtime, data, stale)
+            if first_live:
+                root.after_idle(lambda: trace.mark("first paint of fetched departures"))
+            return hint
+
+        runtime["callback"] = on_data
+        runtime["board"].on_resize = lambda runtime=runtime: board_resized(runtime)
+        subscribe(runtime)
+
+    for index, board_config in enumerate(board_configs):
+        # The first board uses the root window, every further board its own Toplevel
+        window = root if index == 0 else tk.Toplevel(root)
+        sections = build_board_window(window, board_config, scale, get_logo(board_config.get("LogoImage")), marquee)
+        board_sections.append(sections)
+        clocks.append(sections[0]["chrome"]["clock"])
+        # A combined board polls its departures and arrivals side by side
+        for runtime in sections:
+            start_section(runtime)
+
+    trace.mark("logo and board windows")
+
+    def update_board(index, board_config):
+        """Apply a changed board config, touching only what it affects."""
+        sections = board_sections[index]
+        chrome = sections[0]["chrome"]
+        old_config = chrome["config"]
+        if len(board_kinds(old_config)) != len(board_kinds(board_config)):
+            logging.warning("Board {0} was switched to or from combined; restart Novium to apply that".format(index))
+            return
+        chrome["config"] = board_config
+
+        if any(old_config.get(key) != board_config.get(key)
+               for key in ("geometry", "fullscreen", "showcursor", "type", "LogoImage")):
+            logging.info("Rebuilding header of board {0}".format(index))
+            window = sections[0]["window"]
+            configure_window(window, board_config)
+            for frame in chrome["header"]:
+                frame.destroy()
+            chrome["header"], chrome["clock"] = build_header(
+                window, board_config, scale, get_logo(board_config.get("LogoImage")), before=chrome["body"][0])
+            clocks[index] = chrome["clock"]
+
+        for runtime, section_config in zip(sections, section_configs(board_config)):
+            update_section(runtime, section_config)
+
+    def update_section(runtime, board_config):
+        """Apply a changed config to one section of a board."""
+        old_config = runtime["config"]
+        runtime["config"] = board_config
+        name = board_config.get("name", "default")
+
+        def changed(*keys):
+            return any(old_config.get(key) != board_config.get(key) for key in keys)
+
+        rerender = False
+
+        if changed("renderer"):
+            logging.info("Switching renderer of board {0}".format(name))
+            for widget in runtime["content_frame"].winfo_children():
+                widget.destroy()
+            old_board = runtime["board"]
+            runtime["board"] = create_board(runtime["content_frame"], board_config, marquee,
+                                            runtime["board"].shares_window)
+            runtime["board"].on_resize = lambda runtime=runtime: board_resized(runtime)
+            boards[boards.index(old_board)] = runtime["board"]
+            rerender = True
+        elif changed("LineStyles"):
+            runtime["board"].line_styles = LineStyleMatcher(board_config.get("LineStyles", {}))
+            rerender = True
+
+        if changed("CustomResponseMapping", "type"):
+            runtime["accessors"] = compile_mapping(board_config.get("CustomResponseMapping", {}),
+                                                   board_config["type"])
+            rerender = True
+
+        if changed("Filters"):
+            runtime["filters"] = DepartureFilter(board_config.get("Filters"))
+            rerender = True
+
+        query_changed = board_query(runtime) != runtime["query"]
+        if query_changed or changed("updateInterval", "CustomResponseMapping"):
+            logging.info("Departures query of board {0} changed, fetching again".format(name))
+            if runtime["query"] is not None:
+                url, params = runtime["query"]
+                if services["scheduler"] is not None:
+                    services["scheduler"].unsubscribe(url, params, runtime["callback"])
+            if query_changed:
+                runtime["last"] = None
+            subscribe(runtime)
+        elif rerender and runtime["last"] is not None:
+            show_last(runtime)
+
+    def apply_config(new_config):
+        board_configs = validate_config(new_config)
+        logging.info("Applying changed configuration from {0}".format(CONFIG_FILE))
+
+        set_log_level(new_config)
+
+        if services["fetcher"] is not None:
+            services["fetcher"].backoff_max = new_config.get("maxRetryInterval", 300)
+        cache.max_staleness = new_config.get("maxStaleness", 900)
+
+        old_names = [sections[0]["chrome"]["config"].get("name") for sections in board_sections]
+        new_names = [board_config.get("name") for board_config in board_configs]
+        if old_names != new_names:
+            logging.warning("Boards were added or removed; restart Novium to apply that")
+
+        for board_config in board_configs:
+            if board_config.get("name") in old_names:
+                update_board(old_names.index(board_config.get("name")), board_config)
+
+    watcher = ConfigWatcher(root, CONFIG_FILE, apply_config,
+                            interval_ms=int(config.get("configReloadInterval", 2) * 1000))
+    if config.get("configReloadInterval", 2) > 0:
+        watcher.start()
+
+    toggle_colon_visibility = [True]
+    update_clock(root, clocks, toggle_colon_visibility, "#122080")
+    update_countdowns(root, boards)
+
+    # Get the header and any cached departures on screen before the
+    # network modules are imported
+    root.update_idletasks()
+    trace.mark("first paint")
+
+    def start_fetching(modules, error):
+        trace.mark("background imports")
+        if error is not None:
+            for board in boards:
+                board.show_message(passenger_frontend_error_fallback_text,
+                                   font=("DB Neo Screen Sans Regular", 24))
+            return
+        if is_closing:
+            return
+        try:
+            fetcher = modules["modules.fetcher"].create_fetcher(config)
+        except Exception:
+            logging.exception("Failed to set up the {0} data source".format(config.get("dataSource", "http")))
+            for board in boards:
+                board.show_message(passenger_frontend_error_fallback_text,
+                                   font=("DB Neo Screen Sans Regular", 24))
+            return
+        scheduler = modules["modules.scheduler"].FetchScheduler(
+            root, fetcher, cache=cache, max_workers=config.get("maxFetchWorkers", 4),
+            deadline=config.get("fetchDeadline", 20))
+        services["fetcher"] = fetcher
+        services["scheduler"] = scheduler
+        for runtime in runtimes:
+            subscribe(runtime)
+        scheduler.start()
+
+    import_in_background(root, ["modules.fetcher", "modules.scheduler"], start_fetching)
+
+    metrics_server = None
+    if config.get("metricsPort", 0):
+        try:
+            from modules.metricsserver import MetricsServer
+            metrics_server = MetricsServer(config["metricsPort"], host=config.get("metricsHost", "127.0.0.1"),
+                                           max_age=config.get("maxStaleness", 900))
+            metrics_server.start()
+        except Exception as e:
+            logging.error("Failed to start the metrics server: {0}".format(e))
+            metrics_server = None
+        update_metrics(root, marquee, 10000)
+
+    def on_closing():
+        global running, is_closing
+        is_closing = True
+        running = False
+
+        safe_after_cancel(root, clock_after_id)
+        safe_after_cancel(root, countdown_after_id)
+        safe_after_cancel(root, metrics_after_id)
+        if metrics_server is not None:
+            metrics_server.stop()
+        watcher.stop()
+        marquee.stop()
+        if services["scheduler"] is not None:
+            services["scheduler"].stop()
+            services["fetcher"].close()
+        if history is not None:
+            history.stop()
+
+        logging.info("Application closing")
+
+        try:
+            root.quit()
+        except Exception:
+            pass
+
+        root.after(50, root.destroy)
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    for window in root.winfo_children():
+        if isinstance(window, tk.Toplevel):
+            window.protocol("WM_DELETE_WINDOW", on_closing)
+
+    root.mainloop()
+
+    if log_listener is not None:
+        # Write out whatever is still queued
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--bench"]:
+        from modules.bench import main as bench_main
+        sys.exit(bench_main(sys.argv[2:], CONFIG_FILE))
+    if sys.argv[1:2] == ["--soak"]:
+        from modules.soak import main as soak_main
+        sys.exit(soak_main(sys.argv[2:], CONFIG_FILE))
+    if sys.argv[1:2] == ["--serve"]:
+        from modules.proxy import main as serve_main
+        sys.exit(serve_main(sys.argv[2:], CONFIG_FILE))
+    if sys.argv[1:2] == ["--history"]:
+        from modules.history import main as history_main
+        sys.exit(history_main(sys.argv[2:], CONFIG_FILE))
+    main()
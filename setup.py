@@ -1,28 +1,28 @@
-from distutils.core import setup
-import py2exe
-import os
-
-includes = ['requests', 'json', 'os', 'tkinter', 'ctypes', 'datetime', 'logging', 'queue', 'threading', 'modules.utils.luacfgparser']
-
-data_files = [
-    ("images", ["images/DB_logo_white_rgb_200px.png"]),
-    ("fonts", ["fonts/DBNeoScreenSans-Bold.ttf", "fonts/DBNeoScreenSans-Regular.ttf"]),
-    ("", ["novium.cfg", "icon.ico", "cacert.pem"])
-]
-
-setup(
-    version="1.1",
-    windows=[{
-        "script": "Novium.py",
-        "icon_resources": [(1, "icon.ico")]
-    }],
-    options={
-        "py2exe": {
-            "includes": includes,
-            "bundle_files": 3,  
-            "compressed": True
-        }
-    },
-    data_files=data_files,
-    zipfile=None
-)
+from distutils.core import setup
+import py2exe
+import os
+
+includes = ['requests', 'json', 'os', 'tkinter', 'ctypes', 'datetime', 'logging', 'logging.handlers', 'queue', 'threading', 'modules.utils.luacfgparser', 'modules.board', 'modules.canvasboard', 'modules.departures', 'modules.fetcher', 'modules.marquee', 'modules.linestyles', 'modules.bench', 'argparse', 'tracemalloc', 'modules.cache', 'modules.configwatch', 'modules.scheduler', 'concurrent.futures', 'asyncio', 'modules.metrics', 'modules.metricsserver', 'http.server', 'socketserver', 'modules.proxy', 'gzip', 'hashlib', 'urllib.parse', 'modules.assets', 'modules.startup', 'modules.soak', 'gc', 'importlib', 'PIL.Image', 'PIL.ImageTk', 'modules.layout', 'tkinter.font', 'modules.filters', 'modules.replay', 'bisect', 'modules.history', 'struct', 'mmap', 'array']
+
+data_files = [
+    ("images", ["images/DB_logo_white_rgb_200px.png"]),
+    ("fonts", ["fonts/DBNeoScreenSans-Bold.ttf", "fonts/DBNeoScreenSans-Regular.ttf"]),
+    ("", ["novium.cfg", "icon.ico", "cacert.pem"])
+]
+
+setup(
+    version="1.1",
+    windows=[{
+        "script": "Novium.py",
+        "icon_resources": [(1, "icon.ico")]
+    }],
+    options={
+        "py2exe": {
+            "includes": includes,
+            "bundle_files": 3,  
+            "compressed": True
+        }
+    },
+    data_files=data_files,
+    zipfile=None
+)